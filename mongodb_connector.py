@@ -1,12 +1,13 @@
 import os
 import json
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Iterator, Tuple
 from pymongo import MongoClient, errors
 from pymongo.collection import Collection
 from pymongo.database import Database
 from dotenv import load_dotenv
 import logging
 import time
+import importlib.util
 
 # Configurar logging
 logging.basicConfig(
@@ -14,6 +15,68 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Campos de una malla curricular que usan las vistas y el análisis
+CURRICULUM_PROJECTION = {
+    "_id": 0,
+    "universidad": 1,
+    "carrera": 1,
+    "modalidad": 1,
+    "duracion_ciclos": 1,
+    "titulo": 1,
+    "malla_curricular": 1
+}
+
+def semester_format(semester_subjects: List[Any]) -> str:
+    """
+    Determina el formato de las materias de un semestre
+    
+    Args:
+        semester_subjects: Lista de materias del semestre
+        
+    Returns:
+        'str' si todas son strings, 'dict' si todas son diccionarios, 'mixed' en otro caso
+    """
+    if all(isinstance(s, str) for s in semester_subjects):
+        return 'str'
+    if all(isinstance(s, dict) for s in semester_subjects):
+        return 'dict'
+    return 'mixed'
+
+def semester_subject_names(semester_subjects: List[Any], fmt: str) -> List[str]:
+    """
+    Extrae los nombres de las materias de un semestre según su formato
+    
+    Args:
+        semester_subjects: Lista de materias del semestre
+        fmt: Formato calculado con semester_format
+        
+    Returns:
+        Lista de nombres de materias (vacía si el formato es mixto)
+    """
+    if fmt == 'str':
+        return semester_subjects
+    if fmt == 'dict':
+        return [s.get('nombre', '') for s in semester_subjects if 'nombre' in s]
+    return []
+
+def available_compressors() -> str:
+    """
+    Lista de compresores de red que PyMongo puede usar en este entorno, en orden
+    de preferencia. Solo se incluyen zstd y snappy, cuyos paquetes opcionales son
+    rápidos; zlib cuesta más CPU de lo que ahorra en red local y solo se usa si
+    se pide en MONGODB_COMPRESSORS
+    
+    Returns:
+        Compresores separados por comas, tal como los recibe MongoClient (vacío
+        si no hay ninguno instalado)
+    """
+    compressors = []
+    if importlib.util.find_spec("zstandard") is not None:
+        compressors.append("zstd")
+    if importlib.util.find_spec("snappy") is not None:
+        compressors.append("snappy")
+    return ",".join(compressors)
+
 class MongoDBConnector:
     """
     Clase para gestionar la conexión y operaciones con MongoDB
@@ -33,6 +96,21 @@ class MongoDBConnector:
         self.max_retries = 3
         self.retry_delay = 2  # segundos
         
+        # Pool de conexiones, timeouts y compresión (el servidor elige el
+        # primer compresor que soporte)
+        self.client_options = {
+            "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+            "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "10")),
+            "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000")),
+            "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+            "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+            "socketTimeoutMS": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "60000")),
+            "retryWrites": True,
+        }
+        compressors = os.getenv("MONGODB_COMPRESSORS", available_compressors())
+        if compressors:
+            self.client_options["compressors"] = compressors
+        
         # Inicializar como None
         self.client = None
         self.db = None
@@ -57,7 +135,7 @@ class MongoDBConnector:
                     connection_string = f"mongodb://{self.host}:{self.port}/"
                 
                 # Conectar a MongoDB con timeout
-                self.client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
+                self.client = MongoClient(connection_string, **self.client_options)
                 
                 # Verificar la conexión - hacemos una consulta real para confirmar
                 self.client.admin.command('ping')
@@ -102,6 +180,25 @@ class MongoDBConnector:
         """Retorna la base de datos actual o None si no hay conexión"""
         return self.db
     
+    def ensure_indexes(self) -> bool:
+        """
+        Crea (si no existe) el índice compuesto (universidad, carrera) que usan
+        las consultas por universidad y carrera
+        
+        Returns:
+            bool: True si el índice existe o se creó, False en caso contrario
+        """
+        if self.collection is None:
+            logging.error("No hay conexión a MongoDB")
+            return False
+        
+        try:
+            self.collection.create_index([("universidad", 1), ("carrera", 1)])
+            return True
+        except Exception as e:
+            logging.error(f"Error al crear índices: {e}")
+            return False
+    
     # Métodos para operaciones CRUD
     
     def find_one(self, query: Dict = None) -> Optional[Dict]:
@@ -259,7 +356,7 @@ class MongoDBConnector:
         try:
             return list(self.collection.find(
                 {"universidad": university},
-                {"carrera": 1, "duracion_ciclos": 1, "modalidad": 1, "titulo": 1}
+                {"_id": 0, "carrera": 1, "duracion_ciclos": 1, "modalidad": 1, "titulo": 1}
             ))
         except Exception as e:
             logging.error(f"Error al obtener carreras por universidad: {e}")
@@ -293,21 +390,61 @@ class MongoDBConnector:
             career: Nombre de la carrera
             
         Returns:
-            Documento completo con la malla curricular
+            Documento con la malla curricular (solo los campos de CURRICULUM_PROJECTION)
         """
         if self.collection is None:
             logging.error("No hay conexión a MongoDB")
             return None
         
         try:
-            return self.collection.find_one({
-                "universidad": university,
-                "carrera": career
-            })
+            return self.collection.find_one(
+                {"universidad": university, "carrera": career},
+                CURRICULUM_PROJECTION
+            )
         except Exception as e:
             logging.error(f"Error al obtener malla curricular: {e}")
             return None
     
+    def iter_all_curricula(self, batch_size: int = 1000,
+                           include_missing: bool = False) -> Iterator[Tuple[str, str, Optional[List[str]]]]:
+        """
+        Recorre todas las mallas curriculares de la colección en lotes,
+        sin cargar todos los documentos en memoria
+        
+        Args:
+            batch_size: Número de documentos por lote devuelto por el servidor
+            include_missing: Si es True, las carreras sin malla curricular también
+                             se devuelven, con None en lugar de la lista de materias.
+                             Por defecto se omiten
+            
+        Yields:
+            Tuplas (universidad, carrera, lista plana de nombres de materias)
+        """
+        if self.collection is None:
+            logging.error("No hay conexión a MongoDB")
+            return
+        
+        try:
+            cursor = self.collection.find(
+                {},
+                {"_id": 0, "universidad": 1, "carrera": 1, "malla_curricular": 1}
+            ).batch_size(batch_size)
+            
+            for doc in cursor:
+                if "malla_curricular" not in doc:
+                    if include_missing:
+                        yield doc.get("universidad", ""), doc.get("carrera", ""), None
+                    continue
+                
+                subjects = []
+                for semester_subjects in doc["malla_curricular"].values():
+                    # Las materias pueden ser strings o diccionarios con propiedad 'nombre'
+                    subjects.extend(semester_subject_names(semester_subjects, semester_format(semester_subjects)))
+                
+                yield doc.get("universidad", ""), doc.get("carrera", ""), subjects
+        except Exception as e:
+            logging.error(f"Error al recorrer mallas curriculares: {e}")
+    
     def search_careers(self, keyword: str) -> List[Dict]:
         """
         Busca carreras que contengan la palabra clave
@@ -325,7 +462,7 @@ class MongoDBConnector:
         try:
             return list(self.collection.find(
                 {"carrera": {"$regex": keyword, "$options": "i"}},
-                {"universidad": 1, "carrera": 1, "duracion_ciclos": 1}
+                {"_id": 0, "universidad": 1, "carrera": 1, "duracion_ciclos": 1}
             ))
         except Exception as e:
             logging.error(f"Error al buscar carreras: {e}")
@@ -351,7 +488,10 @@ class MongoDBConnector:
             results = []
             
             # Primero obtenemos todas las carreras
-            all_careers = self.collection.find({})
+            all_careers = self.collection.find(
+                {},
+                {"_id": 0, "universidad": 1, "carrera": 1, "malla_curricular": 1}
+            )
             
             for career in all_careers:
                 matching_semesters = {}
@@ -3,6 +3,7 @@ Clase principal para análisis de mallas curriculares
 """
 
 import os
+import re
 import json
 import logging
 from typing import List, Dict, Any, Optional, Tuple
@@ -23,7 +24,7 @@ from utils.abet_utils import (
     evaluate_curriculum_against_abet,
     generate_abet_recommendations
 )
-from mongodb_connector import MongoDBConnector
+from mongodb_connector import MongoDBConnector, CURRICULUM_PROJECTION
 
 # Configurar logging
 logging.basicConfig(
@@ -64,6 +65,7 @@ class CurriculumAnalyzer:
             
             if self.connector.connect():
                 self.db = self.connector.get_database()
+                self.connector.ensure_indexes()
                 logger.info(f"Conexión a MongoDB establecida exitosamente. Base de datos: {db_name}, Colección: {collection_name}")
             else:
                 self.db = None
@@ -103,13 +105,13 @@ class CurriculumAnalyzer:
             return []
             
         try:
-            # Crear expresión regular para búsqueda insensible a mayúsculas/minúsculas
-            import re
-            regex = re.compile(f".*{re.escape(career_name)}.*", re.IGNORECASE)
+            # Búsqueda por subcadena insensible a mayúsculas/minúsculas, resuelta
+            # por el motor de expresiones regulares del servidor
+            career_filter = {"$regex": re.escape(career_name), "$options": "i"}
             
             # Realizar consulta
             collection = self.db[self.collection_name]
-            cursor = collection.find({"carrera": {"$regex": regex}})
+            cursor = collection.find({"carrera": career_filter}, CURRICULUM_PROJECTION).batch_size(100)
             
             # Convertir cursor a lista
             return list(cursor)
@@ -132,16 +134,16 @@ class CurriculumAnalyzer:
             return None
             
         try:
-            # Crear expresión regular para búsqueda insensible a mayúsculas/minúsculas
-            import re
-            regex = re.compile(f".*{re.escape(career_name)}.*", re.IGNORECASE)
+            # Búsqueda por subcadena insensible a mayúsculas/minúsculas, resuelta
+            # por el motor de expresiones regulares del servidor
+            career_filter = {"$regex": re.escape(career_name), "$options": "i"}
             
             # Realizar consulta (con el nombre completo de la universidad)
             collection = self.db[self.collection_name]
             return collection.find_one({
                 "universidad": "Universidad de las Américas (UDLA)",  # Nombre correcto de la universidad
-                "carrera": {"$regex": regex}
-            })
+                "carrera": career_filter
+            }, CURRICULUM_PROJECTION)
         except Exception as e:
             logger.error(f"Error al obtener malla curricular de UDLA: {e}")
             return None
@@ -3,31 +3,56 @@ Servicio de datos para obtener información de universidades y carreras desde Mo
 """
 from typing import List, Dict, Any, Optional
 import logging
+import threading
+from collections import Counter
 from mongodb_connector import MongoDBConnector
 
+# Conector compartido por todas las instancias del servicio, para reutilizar
+# el pool de conexiones de MongoClient en lugar de abrir uno por sesión
+_shared_connector: Optional[MongoDBConnector] = None
+_shared_connector_lock = threading.Lock()
+
+def _get_connector() -> MongoDBConnector:
+    """Retorna el conector compartido, conectándolo la primera vez"""
+    global _shared_connector
+    with _shared_connector_lock:
+        if _shared_connector is None:
+            _shared_connector = MongoDBConnector()
+        if _shared_connector.get_collection() is None:
+            _shared_connector.connect()
+        return _shared_connector
+
 class UniversityDataService:
     """
     Clase para proveer servicios de datos relacionados con universidades y carreras
     """
     def __init__(self):
-        self.db_connector = MongoDBConnector()
-        self.is_connected = False
+        self.db_connector = _get_connector()
+        self.is_connected = self.db_connector.get_collection() is not None
         
     def connect(self) -> bool:
         """Establece conexión con la base de datos"""
-        self.is_connected = self.db_connector.connect()
+        self.db_connector = _get_connector()
+        self.is_connected = self.db_connector.get_collection() is not None
         return self.is_connected
     
+    def _ensure(self) -> bool:
+        """Verifica que haya conexión, intentando conectar si hace falta"""
+        if self.is_connected or self.connect():
+            return True
+        logging.error("No se pudo conectar a la base de datos")
+        return False
+    
     def close(self):
-        """Cierra la conexión con la base de datos"""
-        if self.is_connected:
-            self.db_connector.close()
-            self.is_connected = False
+        """
+        Libera la conexión de esta instancia. El cliente compartido permanece
+        abierto para el resto de instancias del servicio
+        """
+        self.is_connected = False
     
     def get_universities(self) -> List[str]:
         """Obtiene la lista de todas las universidades disponibles"""
-        if not self.is_connected and not self.connect():
-            logging.error("No se pudo conectar a la base de datos")
+        if not self._ensure():
             return []
         
         return self.db_connector.get_universities()
@@ -42,8 +67,7 @@ class UniversityDataService:
         Returns:
             Lista de diccionarios con información de las carreras
         """
-        if not self.is_connected and not self.connect():
-            logging.error("No se pudo conectar a la base de datos")
+        if not self._ensure():
             return []
             
         return self.db_connector.get_careers_by_university(university)
@@ -59,8 +83,7 @@ class UniversityDataService:
         Returns:
             Diccionario con la malla curricular o None si no se encuentra
         """
-        if not self.is_connected and not self.connect():
-            logging.error("No se pudo conectar a la base de datos")
+        if not self._ensure():
             return None
             
         return self.db_connector.get_curriculum_by_university_career(university, career)
@@ -75,8 +98,7 @@ class UniversityDataService:
         Returns:
             Lista de resultados con las materias que coinciden
         """
-        if not self.is_connected and not self.connect():
-            logging.error("No se pudo conectar a la base de datos")
+        if not self._ensure():
             return []
             
         return self.db_connector.search_subjects(keyword)
@@ -88,35 +110,17 @@ class UniversityDataService:
         Returns:
             Diccionario con materias agrupadas por universidad y carrera
         """
-        if not self.is_connected and not self.connect():
-            logging.error("No se pudo conectar a la base de datos")
+        if not self._ensure():
             return {}
         
-        result = {}
-        universities = self.get_universities()
+        result = {university: {} for university in self.get_universities()}
         
-        for university in universities:
-            result[university] = {}
-            careers = self.get_careers_by_university(university)
-            
-            for career_data in careers:
-                career = career_data.get('carrera', '')
-                if not career:
-                    continue
-                    
-                curriculum = self.get_curriculum(university, career)
-                if not curriculum or 'malla_curricular' not in curriculum:
-                    continue
-                    
-                subjects = []
-                for semester, semester_subjects in curriculum['malla_curricular'].items():
-                    # Las materias pueden ser strings o diccionarios con propiedad 'nombre'
-                    if all(isinstance(s, str) for s in semester_subjects):
-                        subjects.extend(semester_subjects)
-                    elif all(isinstance(s, dict) for s in semester_subjects):
-                        subjects.extend([s.get('nombre', '') for s in semester_subjects if 'nombre' in s])
-                
-                result[university][career] = subjects
+        # Recorrer las mallas en lotes desde un único cursor en lugar de
+        # consultar carrera por carrera
+        for university, career, subjects in self.db_connector.iter_all_curricula():
+            if not career:
+                continue
+            result.setdefault(university, {}).setdefault(career, subjects)
         
         return result
 
@@ -127,13 +131,11 @@ class UniversityDataService:
         Returns:
             Diccionario con estadísticas sobre materias
         """
-        if not self.is_connected and not self.connect():
-            logging.error("No se pudo conectar a la base de datos")
+        if not self._ensure():
             return {}
             
-        universities = self.get_universities()
         stats = {
-            'total_universities': len(universities),
+            'total_universities': 0,
             'total_careers': 0,
             'total_subjects': 0,
             'subjects_per_university': {},
@@ -142,55 +144,45 @@ class UniversityDataService:
             'common_subjects': []
         }
         
-        # Obtener todas las materias
-        all_subjects = {}
-        subject_count = {}
+        subject_count = Counter()
+        careers_per_university = Counter()
+        subjects_per_university = Counter()
         
-        for university in universities:
-            careers = self.get_careers_by_university(university)
-            stats['subjects_per_university'][university] = 0
-            stats['careers_per_university'][university] = len(careers)
+        # Un único cursor proyectado recorre todas las carreras, incluidas las
+        # que no tienen malla, en lugar de consultar universidad por universidad
+        # y carrera por carrera
+        for university, career, subjects in self.db_connector.iter_all_curricula(include_missing=True):
+            if not university:
+                continue
+            careers_per_university[university] += 1
+            
+            if not career:
+                continue
+            stats['total_careers'] += 1
+            if subjects is None:
+                continue
+            
+            career_subjects = len(subjects)
             
-            for career_data in careers:
-                career = career_data.get('carrera', '')
-                if not career:
-                    continue
-                    
-                stats['total_careers'] += 1
-                curriculum = self.get_curriculum(university, career)
-                if not curriculum or 'malla_curricular' not in curriculum:
-                    continue
-                
-                career_subjects = 0
-                for semester, semester_subjects in curriculum['malla_curricular'].items():
-                    # Las materias pueden ser strings o diccionarios con propiedad 'nombre'
-                    if all(isinstance(s, str) for s in semester_subjects):
-                        subjects = semester_subjects
-                    elif all(isinstance(s, dict) for s in semester_subjects):
-                        subjects = [s.get('nombre', '') for s in semester_subjects if 'nombre' in s]
-                    else:
-                        subjects = []
-                    
-                    career_subjects += len(subjects)
-                    
-                    # Contar ocurrencias de cada materia
-                    for subject in subjects:
-                        if subject:
-                            if subject not in subject_count:
-                                subject_count[subject] = 0
-                            subject_count[subject] += 1
-                
-                stats['subjects_per_career'][f"{university} - {career}"] = career_subjects
-                stats['subjects_per_university'][university] += career_subjects
-                stats['total_subjects'] += career_subjects
+            # Contar ocurrencias de cada materia
+            subject_count.update(subject for subject in subjects if subject)
+            
+            stats['subjects_per_career'][f"{university} - {career}"] = career_subjects
+            subjects_per_university[university] += career_subjects
+            stats['total_subjects'] += career_subjects
+        
+        universities = sorted(careers_per_university)
+        stats['total_universities'] = len(universities)
+        for university in universities:
+            stats['subjects_per_university'][university] = subjects_per_university[university]
+            stats['careers_per_university'][university] = careers_per_university[university]
         
         # Encontrar materias comunes (que aparecen en al menos 3 carreras)
         common_threshold = 3
         stats['common_subjects'] = [
             {'subject': subject, 'count': count}
-            for subject, count in subject_count.items()
+            for subject, count in subject_count.most_common()
             if count >= common_threshold
         ]
-        stats['common_subjects'].sort(key=lambda x: x['count'], reverse=True)
         
         return stats
@@ -4,7 +4,21 @@ Componentes de UI para la aplicación Streamlit
 import streamlit as st
 from typing import Dict, List, Any, Optional
 import pandas as pd
-import plotly.express as px
+
+__all__ = [
+    'display_header',
+    'display_university_selector',
+    'display_career_selector',
+    'display_curriculum',
+    'display_recommended_curriculum',
+    'display_university_stats',
+    'display_search_subjects',
+    'display_search_results',
+]
+
+# A partir de este número de barras se usa Plotly; por debajo, st.bar_chart
+# es más liviano de construir y de enviar al navegador
+_PLOTLY_MIN_ROWS = 50
 
 def display_header():
     """Muestra el encabezado de la aplicación"""
@@ -49,28 +63,36 @@ def display_curriculum(curriculum_data: Dict[str, Any]):
         st.warning("No se encontró información para esta carrera")
         return
     
-    st.subheader(f"Malla Curricular: {curriculum_data.get('carrera', 'N/A')} - {curriculum_data.get('universidad', 'N/A')}")
+    get = curriculum_data.get
+    carrera = get('carrera', 'N/A')
+    universidad = get('universidad', 'N/A')
+    malla = get('malla_curricular')
+    
+    st.subheader(f"Malla Curricular: {carrera} - {universidad}")
     
     # Mostrar información adicional si existe
-    if 'modalidad' in curriculum_data:
-        st.write(f"**Modalidad:** {curriculum_data['modalidad']}")
+    modalidad = get('modalidad')
+    if modalidad is not None:
+        st.write(f"**Modalidad:** {modalidad}")
     
-    if 'duracion_ciclos' in curriculum_data:
-        st.write(f"**Duración:** {curriculum_data['duracion_ciclos']} ciclos")
+    duracion = get('duracion_ciclos')
+    if duracion is not None:
+        st.write(f"**Duración:** {duracion} ciclos")
     
-    if 'titulo' in curriculum_data:
-        st.write(f"**Título:** {curriculum_data['titulo']}")
+    titulo = get('titulo')
+    if titulo is not None:
+        st.write(f"**Título:** {titulo}")
     
     # Mostrar la malla curricular por semestres
     st.write("### Materias por Semestre")
     
-    if 'malla_curricular' not in curriculum_data:
+    if malla is None:
         st.warning("No se encontró información de la malla curricular")
         return
     
-    tabs = st.tabs([f"Semestre {sem}" for sem in curriculum_data['malla_curricular'].keys()])
+    tabs = st.tabs([f"Semestre {sem}" for sem in malla.keys()])
     
-    for i, (semester, subjects) in enumerate(curriculum_data['malla_curricular'].items()):
+    for i, (semester, subjects) in enumerate(malla.items()):
         with tabs[i]:
             if not subjects:
                 st.write("No hay materias registradas para este semestre")
@@ -78,20 +100,19 @@ def display_curriculum(curriculum_data: Dict[str, Any]):
                 
             # Verificar el formato de las materias
             if isinstance(subjects[0], str):
-                # Si son strings simples
-                for subject in subjects:
-                    st.write(f"- {subject}")
+                # Si son strings simples, enviar toda la lista en un solo mensaje
+                st.markdown("\n".join(f"- {subject}" for subject in subjects))
             elif isinstance(subjects[0], dict):
                 # Si son objetos con más información
                 for subject in subjects:
-                    if 'nombre' in subject:
-                        subject_name = subject['nombre']
-                        
+                    subject_name = subject.get('nombre')
+                    if subject_name is not None:
                         # Crear un expander para mostrar detalles adicionales
                         with st.expander(subject_name):
-                            for key, value in subject.items():
-                                if key != 'nombre':
-                                    st.write(f"**{key.capitalize()}:** {value}")
+                            st.markdown("\n\n".join(
+                                f"**{key.capitalize()}:** {value}"
+                                for key, value in subject.items() if key != 'nombre'
+                            ))
                     else:
                         st.write("- [Materia sin nombre]")
 
@@ -109,9 +130,11 @@ def display_recommended_curriculum(curriculum: Dict, nuevas_materias: Optional[L
         
     st.subheader("Malla Curricular Recomendada")
     
-    # Obtener semestres y ordenarlos numéricamente
-    semesters = list(curriculum.keys())
-    semesters.sort(key=lambda x: int(x) if x.isdigit() else float('inf'))
+    # Conjunto para pruebas de pertenencia en O(1)
+    nuevas_set = frozenset(nuevas_materias or ())
+    
+    # Obtener semestres ordenados numéricamente
+    semesters = _sorted_semesters(tuple(curriculum.keys()))
     
     # Crear columnas para mostrar los semestres
     cols_per_row = 3
@@ -135,7 +158,7 @@ def display_recommended_curriculum(curriculum: Dict, nuevas_materias: Optional[L
                     if isinstance(subjects[0], dict):
                         for subject in subjects:
                             nombre_materia = subject.get('nombre', 'Sin nombre')
-                            es_nueva = nuevas_materias and nombre_materia in nuevas_materias
+                            es_nueva = nombre_materia in nuevas_set
                             color_style = "background-color: #d4f8e8; border-left: 4px solid #34c759;" if es_nueva else "background-color: #f8f9fa;"
                             
                             # Añadir indicador visual (círculo verde) si es materia recomendada
@@ -144,25 +167,48 @@ def display_recommended_curriculum(curriculum: Dict, nuevas_materias: Optional[L
                             else:
                                 displayed_name = nombre_materia
                                 
+                            # Construir el contenido del expander en un solo bloque
+                            details = [
+                                f"**Descripción:** {subject.get('descripcion', 'No disponible')}",
+                                f"**Área:** {subject.get('area', 'No especificada')}",
+                                f"**Tipo:** {subject.get('tipo', 'No especificado')}"
+                            ]
+                            if 'creditos' in subject:
+                                details.append(f"**Créditos:** {subject.get('creditos', 0)}")
+                            elif 'creditos_estimados' in subject:
+                                details.append(f"**Créditos estimados:** {subject.get('creditos_estimados', 0)}")
+                            
                             with st.expander(displayed_name):
-                                st.markdown(f'<div style="{color_style} padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;">', unsafe_allow_html=True)
-                                st.write(f"**Descripción:** {subject.get('descripcion', 'No disponible')}")
-                                st.write(f"**Área:** {subject.get('area', 'No especificada')}")
-                                st.write(f"**Tipo:** {subject.get('tipo', 'No especificado')}")
-                                if 'creditos' in subject:
-                                    st.write(f"**Créditos:** {subject.get('creditos', 0)}")
-                                elif 'creditos_estimados' in subject:
-                                    st.write(f"**Créditos estimados:** {subject.get('creditos_estimados', 0)}")
-                                st.markdown('</div>', unsafe_allow_html=True)
+                                body = "\n\n".join(details)
+                                st.markdown(
+                                    f'<div style="{color_style} padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;">\n\n{body}\n\n</div>',
+                                    unsafe_allow_html=True
+                                )
                     else:
-                        # Si son strings, mostrarlos en una lista simple
+                        # Si son strings, mostrarlos en una lista simple con un solo mensaje
+                        lines = []
                         for subject in subjects:
-                            es_nueva = nuevas_materias and subject in nuevas_materias
+                            es_nueva = subject in nuevas_set
                             if es_nueva:
                                 # Añadir círculo verde al inicio para identificar materias recomendadas
-                                st.markdown(f'<div style="background-color: #d4f8e8; border-left: 4px solid #34c759; padding: 0.2rem; border-radius: 3px; margin-bottom: 0.2rem;">- 🟢 {subject}</div>', unsafe_allow_html=True)
+                                lines.append(f'<div style="background-color: #d4f8e8; border-left: 4px solid #34c759; padding: 0.2rem; border-radius: 3px; margin-bottom: 0.2rem;">- 🟢 {subject}</div>')
                             else:
-                                st.markdown(f"- {subject}")
+                                lines.append(f"- {subject}")
+                        # Separar con líneas en blanco para que los bloques HTML no absorban la lista
+                        st.markdown("\n\n".join(lines), unsafe_allow_html=True)
+
+@st.cache_data
+def _sorted_semesters(keys: tuple) -> tuple:
+    """
+    Ordena las claves de semestre numéricamente; las no numéricas van al final
+    
+    Args:
+        keys: Tupla con las claves de semestre
+        
+    Returns:
+        Tupla con las claves ordenadas
+    """
+    return tuple(sorted(keys, key=lambda x: (not x.isdigit(), int(x) if x.isdigit() else 0)))
 
 def display_university_stats(university_stats: Dict[str, Any]):
     """
@@ -185,14 +231,14 @@ def display_university_stats(university_stats: Dict[str, Any]):
     st.subheader("Carreras por Universidad")
     careers_per_uni = university_stats.get('careers_per_university', {})
     if careers_per_uni:
-        df_uni = pd.DataFrame({
-            'Universidad': list(careers_per_uni.keys()),
-            'Cantidad de Carreras': list(careers_per_uni.values())
-        })
-        fig = px.bar(df_uni, x='Universidad', y='Cantidad de Carreras',
-                    title='Cantidad de Carreras por Universidad',
-                    color='Cantidad de Carreras')
-        st.plotly_chart(fig, use_container_width=True)
+        if len(careers_per_uni) > _PLOTLY_MIN_ROWS:
+            st.plotly_chart(_careers_fig(tuple(careers_per_uni.items())), use_container_width=True)
+        else:
+            df_uni = pd.DataFrame({
+                'Universidad': list(careers_per_uni.keys()),
+                'Cantidad de Carreras': list(careers_per_uni.values())
+            })
+            st.bar_chart(df_uni.set_index('Universidad'))
     
     # Mostrar materias más comunes
     st.subheader("Materias más Comunes")
@@ -200,10 +246,23 @@ def display_university_stats(university_stats: Dict[str, Any]):
     if common_subjects:
         top_n = min(10, len(common_subjects))
         df_common = pd.DataFrame(common_subjects[:top_n])
-        fig = px.bar(df_common, x='subject', y='count',
-                    title=f'Top {top_n} Materias más Comunes',
-                    labels={'subject': 'Materia', 'count': 'Cantidad de Apariciones'})
-        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Top {top_n} materias por cantidad de apariciones")
+        st.bar_chart(df_common.set_index('subject')['count'])
+
+@st.cache_data
+def _careers_fig(items: tuple):
+    """
+    Construye el gráfico Plotly de carreras por universidad (cacheado entre reruns)
+    
+    Args:
+        items: Tupla de pares (universidad, cantidad de carreras)
+    """
+    import plotly.express as px
+    
+    df_uni = pd.DataFrame(list(items), columns=['Universidad', 'Cantidad de Carreras'])
+    return px.bar(df_uni, x='Universidad', y='Cantidad de Carreras',
+                  title='Cantidad de Carreras por Universidad',
+                  color='Cantidad de Carreras')
 
 def display_search_subjects():
     """
@@ -40,7 +40,9 @@ try:
     from .embedding_utils import (
         get_embedding,
         calculate_cosine_similarity,
-        batch_embed_documents
+        batch_cosine_similarity,
+        batch_embed_documents,
+        l2_normalize
     )
 except ImportError:
     print("Warning: No se pudo importar desde embedding_utils")
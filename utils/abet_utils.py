@@ -3,11 +3,24 @@ Utilidades para la integración y evaluación de criterios ABET en mallas curric
 """
 
 import os
+import re
 import json
+import unicodedata
 from typing import Dict, List, Any, Optional
 import logging
+from collections import Counter
+from functools import lru_cache
 from pathlib import Path
 
+try:
+    from .text_processing import normalize_text
+except ImportError:
+    def normalize_text(text: str) -> str:
+        """Normalización mínima (minúsculas, sin acentos) si text_processing no está disponible"""
+        if not text or not isinstance(text, str):
+            return ""
+        return unicodedata.normalize('NFKD', text.lower()).encode('ASCII', 'ignore').decode('ASCII')
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -15,6 +28,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Mapa de palabras clave a categorías ABET (el orden define la prioridad)
+_KEYWORD_TO_CATEGORY = {
+    'civil': 'civil_engineering',
+    'software': 'software_engineering',
+    'industrial': 'industrial_engineering',
+    'electrica': 'electrical_engineering',
+    'electronica': 'electrical_engineering',
+    'mecanica': 'mechanical_engineering',
+    'ambiental': 'environmental_engineering',
+    'sistemas': 'software_engineering',
+    'computacion': 'software_engineering',
+    'informatica': 'software_engineering',
+    'telecomunicaciones': 'electrical_engineering'
+}
+_KEYWORD_PRIORITY = {keyword: i for i, keyword in enumerate(_KEYWORD_TO_CATEGORY)}
+
+# Una sola expresión con todas las palabras clave. El lookahead permite
+# encontrar coincidencias solapadas en cualquier posición del nombre
+_KEYWORD_RE = re.compile(
+    '(?=(' + '|'.join(re.escape(keyword) for keyword in _KEYWORD_TO_CATEGORY) + '))'
+)
+
+# Palabras clave de área predominante de una materia troncal, en orden de prioridad
+_AREA_KEYWORDS = (
+    ('matemática', 'matematicas'),
+    ('ciencia', 'ciencias'),
+    ('ingeniería', 'ingenieria'),
+)
+
 def load_abet_criteria(file_path: str = None) -> Dict[str, Any]:
     """
     Carga los criterios ABET desde un archivo JSON.
@@ -32,14 +74,21 @@ def load_abet_criteria(file_path: str = None) -> Dict[str, Any]:
         file_path = os.path.join(base_dir, 'data', 'criterios_abet.json')
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        return data
+        # Resolver la ruta para que la caché no duplique el mismo archivo
+        return _read_abet_criteria(os.path.abspath(file_path))
     except Exception as e:
         logger.error(f"Error al cargar criterios ABET desde {file_path}: {e}")
         return {}
 
+@lru_cache(maxsize=4)
+def _read_abet_criteria(file_path: str) -> Dict[str, Any]:
+    """
+    Lee y parsea el archivo de criterios ABET una sola vez por ruta.
+    Los errores no se cachean: se propagan a load_abet_criteria.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
 def get_general_criteria(abet_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Extrae los criterios generales de ABET.
@@ -78,6 +127,7 @@ def get_specific_criteria(abet_data: Dict[str, Any], engineering_type: str = Non
         logger.error(f"Error al extraer criterios específicos: {e}")
         return {}
 
+@lru_cache(maxsize=1024)
 def map_career_to_abet_category(career_name: str) -> str:
     """
     Mapea un nombre de carrera a un tipo de ingeniería según ABET.
@@ -89,30 +139,13 @@ def map_career_to_abet_category(career_name: str) -> str:
         Clave del tipo de ingeniería en los criterios ABET
     """
     # Normalizar nombre de carrera (minúsculas, sin acentos)
-    import unicodedata
-    normalized_name = unicodedata.normalize('NFKD', career_name.lower())\
-                               .encode('ASCII', 'ignore')\
-                               .decode('ASCII')
-    
-    # Mapa de palabras clave a categorías ABET
-    keyword_to_category = {
-        'civil': 'civil_engineering',
-        'software': 'software_engineering',
-        'industrial': 'industrial_engineering',
-        'electrica': 'electrical_engineering',
-        'electronica': 'electrical_engineering',
-        'mecanica': 'mechanical_engineering',
-        'ambiental': 'environmental_engineering',
-        'sistemas': 'software_engineering',
-        'computacion': 'software_engineering',
-        'informatica': 'software_engineering',
-        'telecomunicaciones': 'electrical_engineering'
-    }
+    normalized_name = normalize_text(career_name)
     
-    # Buscar palabras clave en el nombre de la carrera
-    for keyword, category in keyword_to_category.items():
-        if keyword in normalized_name:
-            return category
+    # Buscar todas las palabras clave en una sola pasada y quedarse con la
+    # de mayor prioridad, igual que recorrer el mapa en orden
+    matches = _KEYWORD_RE.findall(normalized_name)
+    if matches:
+        return _KEYWORD_TO_CATEGORY[min(matches, key=_KEYWORD_PRIORITY.__getitem__)]
     
     # Si no hay coincidencia específica, devolver None
     return None
@@ -140,10 +173,12 @@ def evaluate_curriculum_against_abet(curriculum: Dict[str, Any], abet_data: Dict
         # Aplanar malla curricular para análisis
         subjects = []
         for semester, semester_subjects in curriculum.get('malla_curricular', {}).items():
-            if all(isinstance(s, str) for s in semester_subjects):
+            # El formato de un semestre lo define su primera materia
+            first = semester_subjects[0] if semester_subjects else None
+            if isinstance(first, str):
                 subjects.extend(semester_subjects)
-            elif all(isinstance(s, dict) for s in semester_subjects):
-                subjects.extend([s.get('nombre', '') for s in semester_subjects if 'nombre' in s])
+            elif isinstance(first, dict):
+                subjects.extend(s['nombre'] for s in semester_subjects if 'nombre' in s)
         
         # Inicializar resultados
         evaluation = {
@@ -227,29 +262,23 @@ def generate_abet_recommendations(curriculum: Dict[str, Any],
                     'sugerencia': f"Revisar materias relacionadas con: {req}"
                 })
         
-        # Basándonos en las materias troncales, sugerir ajustes según ABET
-        materias_matematicas = 0
-        materias_ciencias = 0
-        materias_ingenieria = 0
-        materias_generales = 0
-        
-        # Contar materias por área (implementar lógica específica según la estructura de datos)
+        # Basándonos en las materias troncales, sugerir ajustes según ABET.
+        # Contar materias por área (la primera palabra clave que coincide gana)
+        areas = Counter()
         for subject in core_subjects:
             area = subject.get('area_predominante', '').lower()
-            if 'matemática' in area:
-                materias_matematicas += 1
-            elif 'ciencia' in area:
-                materias_ciencias += 1
-            elif 'ingeniería' in area:
-                materias_ingenieria += 1
+            for keyword, bucket in _AREA_KEYWORDS:
+                if keyword in area:
+                    areas[bucket] += 1
+                    break
             else:
-                materias_generales += 1
+                areas['generales'] += 1
         
         # Evaluar cumplimiento de proporciones según ABET
-        total_materias = materias_matematicas + materias_ciencias + materias_ingenieria + materias_generales
+        total_materias = len(core_subjects)
         if total_materias > 0:
-            porcentaje_matematicas_ciencias = (materias_matematicas + materias_ciencias) / total_materias * 100
-            porcentaje_ingenieria = materias_ingenieria / total_materias * 100
+            porcentaje_matematicas_ciencias = (areas['matematicas'] + areas['ciencias']) / total_materias * 100
+            porcentaje_ingenieria = areas['ingenieria'] / total_materias * 100
             
             recommendations['cumplimiento_estimado'] = {
                 'matematicas_ciencias': {
@@ -2,12 +2,15 @@
 Utilidades para análisis de mallas curriculares y recomendación de materias
 """
 
+import unicodedata
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple, Set
-from collections import defaultdict
+from collections import Counter, defaultdict
 # Importamos las bibliotecas necesarias para fuzzy matching
-from difflib import SequenceMatcher
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from .data_utils import flatten_curriculum
 
 try:
     from sklearn.cluster import AgglomerativeClustering
@@ -16,6 +19,20 @@ except ImportError:
     print("Por favor, instale scikit-learn con: pip install scikit-learn>=1.3.0")
     AgglomerativeClustering = None
 
+# fastcluster es opcional: si está instalado se usa para el clustering jerárquico
+try:
+    import fastcluster
+    from scipy.cluster.hierarchy import fcluster
+    from scipy.spatial.distance import squareform
+except ImportError:
+    fastcluster = None
+
+# scipy (dependencia de scikit-learn) permite separar el problema en componentes
+try:
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    connected_components = None
+
 # Intentar importar las funciones de otros módulos de manera segura
 try:
     from .text_processing import normalize_text
@@ -24,57 +41,150 @@ except ImportError:
     normalize_text = lambda x: x if isinstance(x, str) else ""
 
 try:
-    from .embedding_utils import get_embedding, calculate_cosine_similarity, batch_embed_documents
+    from .embedding_utils import get_embedding, calculate_cosine_similarity, batch_cosine_similarity, batch_embed_documents
 except ImportError:
     print("Error: No se pudieron importar funciones desde embedding_utils")
     # Definir versiones dummy de las funciones
     get_embedding = lambda x, model_name="": np.zeros(384)
     calculate_cosine_similarity = lambda x, y: 0.0
-    batch_embed_documents = lambda docs, model_name="", use_cache=False, cache_file=None: np.zeros((len(docs), 384))
+    batch_cosine_similarity = lambda A, B, assume_normalized=False: np.zeros((len(A), len(B)))
+    batch_embed_documents = lambda docs, model_name="", use_cache=False: np.zeros((len(docs), 384))
 
-def flatten_curriculum(curriculum: Dict) -> List[Dict]:
+def _average_linkage_labels(distances: np.ndarray, distance_threshold: float) -> np.ndarray:
     """
-    Aplana una malla curricular para obtener una lista de todas las materias.
+    Clustering jerárquico aglomerativo con enlace promedio sobre una matriz
+    de distancias ya calculada.
     
     Args:
-        curriculum: Diccionario con la malla curricular
+        distances: Matriz cuadrada de distancias (n, n)
+        distance_threshold: Distancia a partir de la cual no se fusionan clusters
         
     Returns:
-        Lista de materias
+        Etiqueta de cluster (desde 0) de cada fila
     """
-    subjects = []
-    
-    # Verificar si la malla tiene el formato enriquecido
-    is_enriched = False
-    
-    # Explorar el primer semestre para detectar el formato
-    first_semester_key = next(iter(curriculum['malla_curricular']), None)
-    if first_semester_key and curriculum['malla_curricular'][first_semester_key]:
-        first_subject = curriculum['malla_curricular'][first_semester_key][0]
-        is_enriched = isinstance(first_subject, dict) and 'nombre' in first_subject
-    
-    # Recorrer cada semestre
-    for semestre, materias in curriculum['malla_curricular'].items():
-        if is_enriched:
-            # Formato enriquecido
-            for materia in materias:
-                # Añadir semestre a la materia
-                materia_con_semestre = materia.copy()
-                materia_con_semestre['semestre'] = semestre
-                materia_con_semestre['universidad'] = curriculum.get('universidad', '')
-                materia_con_semestre['carrera'] = curriculum.get('carrera', '')
-                subjects.append(materia_con_semestre)
-        else:
-            # Formato simple (lista de strings)
-            for materia in materias:
-                subjects.append({
-                    'nombre': materia,
-                    'semestre': semestre,
-                    'universidad': curriculum.get('universidad', ''),
-                    'carrera': curriculum.get('carrera', '')
-                })
-    
-    return subjects
+    if fastcluster is not None:
+        Z = fastcluster.linkage(squareform(distances, checks=False), method='average')
+        # sklearn fusiona solo por debajo del umbral; fcluster incluye el
+        # propio umbral, así que se corta justo antes
+        return fcluster(Z, t=np.nextafter(distance_threshold, 0), criterion='distance') - 1
+    
+    clustering = AgglomerativeClustering(
+        n_clusters=None,
+        distance_threshold=distance_threshold,
+        metric='precomputed',
+        linkage='average'
+    )
+    return clustering.fit_predict(distances)
+
+def _cluster_labels(embeddings: np.ndarray, distance_threshold: float) -> np.ndarray:
+    """
+    Clustering jerárquico aglomerativo (enlace promedio, distancia coseno)
+    cortado en distance_threshold.
+    
+    Args:
+        embeddings: Matriz de embeddings normalizados (n, dimensión), como
+                    los de batch_embed_documents
+        distance_threshold: Distancia a partir de la cual no se fusionan clusters
+        
+    Returns:
+        Etiqueta de cluster de cada fila
+    """
+    n = len(embeddings)
+    if n < 2:
+        return np.zeros(n, dtype=int)
+    
+    # Con las filas ya normalizadas, la distancia coseno es 1 - producto
+    # punto: una sola multiplicación de matrices en lugar de que sklearn
+    # recalcule normas por par
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    distances = 1.0 - embeddings @ embeddings.T
+    np.clip(distances, 0.0, 2.0, out=distances)
+    np.fill_diagonal(distances, 0.0)
+    
+    # Con enlace promedio dos clusters solo se fusionan si algún par entre
+    # ellos está por debajo del umbral, así que ningún cluster cruza las
+    # componentes conexas del grafo (distancia < umbral). Se agrupa cada
+    # componente por separado y el resultado es el mismo que sobre el total
+    if connected_components is None:
+        return _average_linkage_labels(distances, distance_threshold)
+    
+    n_components, components = connected_components(distances < distance_threshold, directed=False)
+    order = np.argsort(components, kind='stable')
+    members = np.split(order, np.cumsum(np.bincount(components, minlength=n_components))[:-1])
+    
+    labels = np.empty(n, dtype=int)
+    next_label = 0
+    for idx in members:
+        if len(idx) == 1:
+            labels[idx] = next_label
+            next_label += 1
+            continue
+        
+        sub_labels = _average_linkage_labels(distances[np.ix_(idx, idx)], distance_threshold)
+        labels[idx] = sub_labels + next_label
+        next_label += int(sub_labels.max()) + 1
+    
+    return labels
+
+def _cluster_modes(labels: np.ndarray, values: List[Any]) -> Dict[int, Any]:
+    """
+    Calcula el valor más frecuente (ignorando vacíos) de cada cluster para
+    todos los clusters a la vez. Los empates se resuelven por la primera
+    aparición, igual que Counter.most_common(1).
+    
+    Args:
+        labels: Etiqueta de cluster (no negativa) de cada elemento
+        values: Valor de cada elemento, en el mismo orden que labels
+        
+    Returns:
+        Diccionario etiqueta -> valor predominante (sin entrada si el cluster
+        no tiene valores)
+    """
+    # Codificar los valores como enteros (-1 para vacíos)
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(v, len(index)) if v else -1 for v in values),
+        dtype=np.int64, count=len(values)
+    )
+    valid = codes >= 0
+    if not valid.any():
+        return {}
+    
+    # Contar cada par (cluster, valor) y su primera aparición
+    n_values = len(index)
+    positions = np.flatnonzero(valid)
+    keys = np.asarray(labels, dtype=np.int64)[valid] * n_values + codes[valid]
+    pair_keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    pair_labels = pair_keys // n_values
+    pair_codes = pair_keys % n_values
+    
+    # Ordenar por cluster, luego por frecuencia descendente y luego por
+    # primera aparición, y quedarse con el primer par de cada cluster
+    order = np.lexsort((positions[first], -counts, pair_labels))
+    sorted_labels = pair_labels[order]
+    winners = order[np.r_[True, sorted_labels[1:] != sorted_labels[:-1]]]
+    
+    decoded = list(index)
+    return {int(label): decoded[code] for label, code in zip(pair_labels[winners], pair_codes[winners])}
+
+def _embed_unique(texts: List[str], model_name: str) -> np.ndarray:
+    """
+    Genera embeddings codificando una sola vez cada texto distinto y
+    reconstruyendo la matriz en el orden original.
+    
+    Args:
+        texts: Lista de textos (puede contener repetidos)
+        model_name: Modelo de embeddings a utilizar
+        
+    Returns:
+        Matriz de embeddings (len(texts), dimensión)
+    """
+    if not texts:
+        return batch_embed_documents(texts, model_name)
+    
+    unique_texts, inverse = np.unique(texts, return_inverse=True)
+    unique_embeddings = batch_embed_documents(unique_texts.tolist(), model_name)
+    return np.asarray(unique_embeddings)[inverse.ravel()]
 
 def group_similar_subjects(subjects: List[Dict], 
                           similarity_threshold: float = 0.8,
@@ -108,66 +218,44 @@ def group_similar_subjects(subjects: List[Dict],
     
     # Obtener embeddings
     print(f"Generando embeddings para {len(combined_texts)} materias...")
-    embeddings = batch_embed_documents(combined_texts, model_name)
+    embeddings = _embed_unique(combined_texts, model_name)
     
     # Aplicar clustering jerárquico
     print("Aplicando clustering para agrupar materias similares...")
     distance_threshold = 1.0 - similarity_threshold
-    clustering = AgglomerativeClustering(
-        n_clusters=None,
-        distance_threshold=distance_threshold,
-        metric='cosine',
-        linkage='average'
-    )
     
     # Obtener etiquetas de cluster
-    labels = clustering.fit_predict(embeddings)
+    labels = _cluster_labels(embeddings, distance_threshold)
     
     # Agrupar materias por cluster
     clusters = defaultdict(list)
     for i, label in enumerate(labels):
         clusters[int(label)].append(subjects[i])
     
+    # Área, tipo y nombre predominantes de todos los clusters a la vez
+    area_modes = _cluster_modes(labels, [s.get('area', '') for s in subjects])
+    tipo_modes = _cluster_modes(labels, [s.get('tipo', '') for s in subjects])
+    name_modes = _cluster_modes(labels, [s.get('nombre', '') for s in subjects])
+    
     # Convertir a formato de resultado
     result = []
     for label, cluster_subjects in clusters.items():
-        # Identificar la materia representativa del cluster (la que tiene más universidades)
-        univ_counts = {}
-        for s in cluster_subjects:
-            univ = s.get('universidad', '')
-            if univ:
-                univ_counts[univ] = univ_counts.get(univ, 0) + 1
+        universidades = {s.get('universidad', '') for s in cluster_subjects}
         
         # Determinar área y tipo predominantes
-        areas = {}
-        tipos = {}
-        for s in cluster_subjects:
-            area = s.get('area', '')
-            tipo = s.get('tipo', '')
-            if area:
-                areas[area] = areas.get(area, 0) + 1
-            if tipo:
-                tipos[tipo] = tipos.get(tipo, 0) + 1
-        
-        area_predominante = max(areas.items(), key=lambda x: x[1])[0] if areas else ''
-        tipo_predominante = max(tipos.items(), key=lambda x: x[1])[0] if tipos else ''
+        area_predominante = area_modes.get(label, '')
+        tipo_predominante = tipo_modes.get(label, '')
         
         # Crear nombre general para el grupo
         # Usar la materia más común como nombre de referencia
-        name_counts = {}
-        for s in cluster_subjects:
-            name = s.get('nombre', '')
-            if name:
-                name_counts[name] = name_counts.get(name, 0) + 1
-        
-        nombre_general = max(name_counts.items(), key=lambda x: x[1])[0] if name_counts else "Sin nombre"
+        nombre_general = name_modes.get(label, "Sin nombre")
         
         # Crear registro de grupo
         group = {
             "nombre_general": nombre_general,
             "materias_equivalentes": [s.get('nombre', '') for s in cluster_subjects],
-            "universidades": list(set([s.get('universidad', '') for s in cluster_subjects])),
-            "frecuencia": len(set([s.get('universidad', '') for s in cluster_subjects])),
+            "universidades": list(universidades),
+            "frecuencia": len(universidades),
             "area_predominante": area_predominante,
             "tipo_predominante": tipo_predominante,
             "materias": cluster_subjects
@@ -238,29 +326,34 @@ def compare_curricula(core_subjects: List[Dict],
             udla_combined_texts.append(name)
     
     # Obtener embeddings de materias de la UDLA
-    udla_embeddings = batch_embed_documents(udla_combined_texts, model_name)
+    udla_embeddings = _embed_unique(udla_combined_texts, model_name)
+    
+    # Crear embeddings para los nombres generales de las materias troncales en
+    # un solo lote
+    core_texts = [c["nombre_general"] for c in core_subjects]
+    core_embeddings = _embed_unique(core_texts, model_name)
+    
+    # Similitud del coseno de todas las troncales contra todas las materias
+    # de la UDLA en una sola multiplicación de matrices
+    if len(udla_subjects) > 0 and len(core_subjects) > 0:
+        sims = batch_cosine_similarity(core_embeddings, udla_embeddings, assume_normalized=True)
+        best_idx = sims.argmax(axis=1)
+        best_sim = sims[np.arange(len(core_subjects)), best_idx]
+    else:
+        best_idx = np.zeros(len(core_subjects), dtype=int)
+        best_sim = np.zeros(len(core_subjects))
     
     # Comparar cada materia troncal con las de la UDLA
     existing_subjects = []
     missing_subjects = []
     
-    for core_subject in core_subjects:
-        # Crear embedding para el nombre general de la materia troncal
-        core_embedding = get_embedding(core_subject["nombre_general"], model_name)
-        
-        # Verificar similitud con materias de la UDLA
-        max_similarity = 0
-        most_similar_subject = None
-        
-        for i, udla_embedding in enumerate(udla_embeddings):
-            similarity = calculate_cosine_similarity(core_embedding, udla_embedding)
-            
-            if similarity > max_similarity:
-                max_similarity = similarity
-                most_similar_subject = udla_subjects[i]
+    for i, core_subject in enumerate(core_subjects):
+        # Solo cuentan similitudes positivas, como en la comparación uno a uno
+        max_similarity = max(float(best_sim[i]), 0.0)
+        most_similar_subject = udla_subjects[best_idx[i]] if max_similarity > 0 else None
         
         # Determinar si existe o no
-        if max_similarity >= similarity_threshold:
+        if most_similar_subject is not None and max_similarity >= similarity_threshold:
             # La materia existe
             existing_subjects.append({
                 "materia_troncal": core_subject["nombre_general"],
@@ -279,9 +372,13 @@ def compare_curricula(core_subjects: List[Dict],
             if "materias" in core_subject:
                 semestres_equivalentes = [int(m.get("semestre", "1")) for m in core_subject["materias"] if m.get("semestre")]
                 if semestres_equivalentes:
-                    # Usar el semestre más común para esta materia
-                    from collections import Counter
-                    semestre_sugerido = str(Counter(semestres_equivalentes).most_common(1)[0][0])
+                    # Usar el semestre más común para esta materia (en listas
+                    # cortas contar directamente es más barato que un Counter;
+                    # ambos desempatan por la primera aparición)
+                    if len(semestres_equivalentes) < 16:
+                        semestre_sugerido = str(max(semestres_equivalentes, key=semestres_equivalentes.count))
+                    else:
+                        semestre_sugerido = str(Counter(semestres_equivalentes).most_common(1)[0][0])
             
             # La materia no existe
             missing_subjects.append({
@@ -299,6 +396,36 @@ def compare_curricula(core_subjects: List[Dict],
     }
 
 
+def _fuzzy_process(name: str) -> str:
+    """
+    Preprocesado de nombres para la comparación fuzzy: quita tildes y demás
+    caracteres no ASCII y luego aplica default_process de rapidfuzz
+    (minúsculas, solo alfanuméricos). Así los nombres con y sin tildes se
+    comparan igual
+    """
+    folded = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return default_process(folded)
+
+def _subject_key(materia: Any) -> Optional[str]:
+    """
+    Obtiene el nombre normalizado (minúsculas, sin espacios extremos) de una
+    materia, ya sea un string o un diccionario con campo 'nombre'.
+    
+    Args:
+        materia: Materia en cualquiera de los dos formatos
+        
+    Returns:
+        Nombre normalizado o None si el formato no se reconoce
+    """
+    if isinstance(materia, str):
+        return materia.lower().strip()
+    if isinstance(materia, dict) and 'nombre' in materia:
+        return materia['nombre'].lower().strip()
+    
+    # Para otros formatos imprevistos, dejar constancia y omitir la materia
+    print(f"Formato de materia no reconocido: {type(materia)}")
+    return None
+
 def generate_recommendations(comparison: Dict, 
                             udla_curriculum: Dict, 
                             core_subjects: List[Dict],
@@ -321,50 +448,67 @@ def generate_recommendations(comparison: Dict,
         recommended_curriculum[semestre] = list(materias)
     
     # Crear lista plana de todas las materias existentes para verificación
-    all_existing_subjects = []
-    for semestre, materias in udla_curriculum['malla_curricular'].items():
-        # Manejar tanto strings como diccionarios
-        for materia in materias:
-            if isinstance(materia, dict) and 'nombre' in materia:
-                # Si la materia es un diccionario con campo 'nombre'
-                all_existing_subjects.append(materia['nombre'].lower().strip())
-            elif isinstance(materia, str):
-                # Si la materia es directamente un string
-                all_existing_subjects.append(materia.lower().strip())
-            else:
-                # Para otros formatos imprevistos, añadir un log o manejo específico
-                print(f"Formato de materia no reconocido: {type(materia)}")
+    all_existing_subjects = [
+        key
+        for materias in udla_curriculum['malla_curricular'].values()
+        for key in map(_subject_key, materias)
+        if key is not None
+    ]
+    existing_set = set(all_existing_subjects)
     
     # Procesar materias a agregar
     subjects_to_add = comparison.get('materias_a_agregar', [])
+    candidates = [s.get('nombre_recomendado', '').lower().strip() for s in subjects_to_add]
+    
+    # Similitudes de todas las candidatas contra las materias originales en
+    # una sola llamada vectorizada por métrica, redondeadas a enteros. Las tres
+    # métricas comparan los nombres sin tildes (ver _fuzzy_process)
+    base_subjects = list(all_existing_subjects)
+    if candidates and base_subjects:
+        ratios = np.rint(process.cdist(candidates, base_subjects, scorer=fuzz.ratio,
+                                       processor=_fuzzy_process, workers=-1))
+        partial_ratios = np.rint(process.cdist(candidates, base_subjects, scorer=fuzz.partial_ratio,
+                                               processor=_fuzzy_process, workers=-1))
+        token_sort_ratios = np.rint(process.cdist(candidates, base_subjects, scorer=fuzz.token_sort_ratio,
+                                                  processor=_fuzzy_process, workers=-1))
+        duplicates = (ratios > similarity_threshold) | (partial_ratios > 95) | (token_sort_ratios > similarity_threshold)
+    else:
+        duplicates = np.zeros((len(candidates), len(base_subjects)), dtype=bool)
     
-    for subject in subjects_to_add:
+    for idx, subject in enumerate(subjects_to_add):
         # Extraer detalles relevantes
         nombre_recomendado = subject.get('nombre_recomendado', '')
         semestre_sugerido = subject.get('semestre_sugerido', '1')
         
         # Normalizar el nombre recomendado
-        nombre_normalizado = nombre_recomendado.lower().strip()
+        nombre_normalizado = candidates[idx]
         
         # Verificar si la materia ya existe (verificación exacta)
-        if nombre_normalizado in all_existing_subjects:
+        if nombre_normalizado in existing_set:
             continue
         
-        # Verificar si hay alguna materia muy similar (verificación fuzzy)
-        is_duplicate = False
-        for existing_subject in all_existing_subjects:
-            # Comparamos con diferentes algoritmos de similitud para mayor seguridad
-            ratio = fuzz.ratio(nombre_normalizado, existing_subject)
-            partial_ratio = fuzz.partial_ratio(nombre_normalizado, existing_subject)
-            token_sort_ratio = fuzz.token_sort_ratio(nombre_normalizado, existing_subject)
-            
-            # Si cualquier métrica de similitud supera el umbral, consideramos que es un duplicado
-            if ratio > similarity_threshold or partial_ratio > 95 or token_sort_ratio > similarity_threshold:
-                print(f"Materia similar encontrada: '{nombre_recomendado}' vs '{existing_subject}' - Similitud: {ratio}%")
-                is_duplicate = True
-                break
+        # Verificar si hay alguna materia muy similar (verificación fuzzy),
+        # primero contra las originales y luego contra las ya agregadas
+        duplicate_of = None
+        if duplicates[idx].any():
+            j = int(duplicates[idx].argmax())
+            duplicate_of = (base_subjects[j], int(ratios[idx, j]))
+        else:
+            for existing_subject in all_existing_subjects[len(base_subjects):]:
+                ratio = round(fuzz.ratio(nombre_normalizado, existing_subject,
+                                         processor=_fuzzy_process))
+                partial_ratio = round(fuzz.partial_ratio(nombre_normalizado, existing_subject,
+                                                         processor=_fuzzy_process))
+                token_sort_ratio = round(fuzz.token_sort_ratio(nombre_normalizado, existing_subject,
+                                                               processor=_fuzzy_process))
+                
+                # Si cualquier métrica de similitud supera el umbral, consideramos que es un duplicado
+                if ratio > similarity_threshold or partial_ratio > 95 or token_sort_ratio > similarity_threshold:
+                    duplicate_of = (existing_subject, ratio)
+                    break
         
-        if is_duplicate:
+        if duplicate_of is not None:
+            print(f"Materia similar encontrada: '{nombre_recomendado}' vs '{duplicate_of[0]}' - Similitud: {duplicate_of[1]}%")
             continue
             
         # Si no es duplicada, la añadimos al semestre sugerido
@@ -372,5 +516,6 @@ def generate_recommendations(comparison: Dict,
             recommended_curriculum[semestre_sugerido].append(nombre_recomendado)
             # Añadimos a la lista de materias existentes para siguientes comparaciones
             all_existing_subjects.append(nombre_normalizado)
+            existing_set.add(nombre_normalizado)
     
     return recommended_curriculum
\ No newline at end of file
@@ -4,11 +4,41 @@ Utilidades para operaciones con datos de mallas curriculares
 
 import json
 import os
-from typing import List, Dict, Any, Optional, Union
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Union
 from pathlib import Path
 import pymongo
 from pymongo import MongoClient
 
+# orjson es opcional: si está disponible se usa para leer y escribir JSON
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+@lru_cache(maxsize=8)
+def _get_client(connection_string: str) -> MongoClient:
+    """
+    Crea un MongoClient por cadena de conexión y lo reutiliza en llamadas
+    posteriores. El ping solo se hace al crearlo; si falla, la excepción no
+    queda en caché y el siguiente intento vuelve a conectar.
+    """
+    client = MongoClient(connection_string, serverSelectionTimeoutMS=5000, maxPoolSize=50)
+    # Verificar conexión
+    client.admin.command('ping')
+    return client
+
+@lru_cache(maxsize=8)
+def _get_database(connection_string: str, db_name: str) -> pymongo.database.Database:
+    """
+    Obtiene la base de datos y, la primera vez, crea el índice (universidad,
+    carrera) que usan las consultas de este módulo
+    """
+    db = _get_client(connection_string)[db_name]
+    ensure_indexes(db)
+    return db
+
 def connect_to_mongodb(connection_string: Optional[str] = None, 
                       db_name: str = "carreras_universitarias") -> pymongo.database.Database:
     """
@@ -25,16 +55,67 @@ def connect_to_mongodb(connection_string: Optional[str] = None,
         connection_string = "mongodb://localhost:27017/"
     
     try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        # Verificar conexión
-        client.admin.command('ping')
-        return client[db_name]
+        return _get_database(connection_string, db_name)
     except Exception as e:
         import logging
         logging.error(f"Error al conectar a MongoDB: {e}")
         # Devolver None en lugar de levantar una excepción
         return None
 
+# Campos de una malla curricular que usa el análisis
+_CURRICULUM_FIELDS = {"_id": 0, "universidad": 1, "carrera": 1, "malla_curricular": 1}
+
+def ensure_indexes(db: pymongo.database.Database,
+                   collection_name: str = "mallas_curriculares") -> bool:
+    """
+    Crea (si no existe) el índice compuesto (universidad, carrera).
+    
+    Args:
+        db: Base de datos MongoDB
+        collection_name: Nombre de la colección
+        
+    Returns:
+        True si el índice existe o se creó, False en caso contrario
+    """
+    if db is None:
+        return False
+        
+    try:
+        db[collection_name].create_index([("universidad", 1), ("carrera", 1)])
+        return True
+    except Exception as e:
+        import logging
+        logging.error(f"Error al crear índices: {e}")
+        return False
+
+def iter_career_documents(db: pymongo.database.Database,
+                          career_name: str,
+                          collection_name: str = "mallas_curriculares",
+                          batch_size: int = 100) -> Iterator[Dict]:
+    """
+    Recorre los documentos de carreras desde MongoDB sin cargarlos todos en
+    memoria. Los errores de la consulta se propagan al iterar.
+    
+    Args:
+        db: Objeto de base de datos MongoDB
+        career_name: Nombre de la carrera a buscar
+        collection_name: Nombre de la colección
+        batch_size: Número de documentos por lote devuelto por el servidor
+        
+    Yields:
+        Documentos encontrados (solo los campos de _CURRICULUM_FIELDS)
+    """
+    if db is None:
+        import logging
+        logging.error("No hay conexión a la base de datos MongoDB")
+        return
+    
+    # Búsqueda por subcadena insensible a mayúsculas/minúsculas, resuelta
+    # por el motor de expresiones regulares del servidor
+    career_filter = {"$regex": re.escape(career_name), "$options": "i"}
+    
+    yield from db[collection_name].find({"carrera": career_filter}, _CURRICULUM_FIELDS).batch_size(batch_size)
+
 def get_career_documents(db: pymongo.database.Database, 
                         career_name: str, 
                         collection_name: str = "mallas_curriculares") -> List[Dict]:
@@ -56,15 +137,7 @@ def get_career_documents(db: pymongo.database.Database,
         return []
         
     try:
-        # Crear expresión regular para búsqueda insensible a mayúsculas/minúsculas
-        import re
-        regex = re.compile(f".*{re.escape(career_name)}.*", re.IGNORECASE)
-        
-        # Realizar consulta
-        cursor = db[collection_name].find({"carrera": {"$regex": regex}})
-        
-        # Convertir cursor a lista
-        return list(cursor)
+        return list(iter_career_documents(db, career_name, collection_name))
     except Exception as e:
         import logging
         logging.error(f"Error al obtener documentos de carreras: {e}")
@@ -91,15 +164,15 @@ def get_udla_curriculum(db: pymongo.database.Database,
         return None
         
     try:
-        # Crear expresión regular para búsqueda insensible a mayúsculas/minúsculas
-        import re
-        regex = re.compile(f".*{re.escape(career_name)}.*", re.IGNORECASE)
+        # Búsqueda por subcadena insensible a mayúsculas/minúsculas, resuelta
+        # por el motor de expresiones regulares del servidor
+        career_filter = {"$regex": re.escape(career_name), "$options": "i"}
         
         # Realizar consulta
         return db[collection_name].find_one({
             "universidad": "UDLA",
-            "carrera": {"$regex": regex}
-        })
+            "carrera": career_filter
+        }, _CURRICULUM_FIELDS)
     except Exception as e:
         import logging
         logging.error(f"Error al obtener malla curricular de UDLA: {e}")
@@ -115,6 +188,10 @@ def load_json_data(file_path: Union[str, Path]) -> Dict:
     Returns:
         Datos cargados desde el archivo
     """
+    if orjson is not None:
+        with open(file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
@@ -127,6 +204,12 @@ def save_json_data(data: Dict, file_path: Union[str, Path], indent: int = 2) ->
         file_path: Ruta donde guardar el archivo
         indent: Nivel de indentación
     """
+    # orjson solo admite indentación de 2 espacios
+    if orjson is not None and indent == 2:
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
+    
     with open(file_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=indent)
 
@@ -138,37 +221,19 @@ def flatten_curriculum(curriculum: Dict) -> List[Dict]:
         curriculum: Diccionario con la malla curricular
         
     Returns:
-        Lista de materias
+        Lista de materias, cada una con su semestre, universidad y carrera
     """
     subjects = []
+    universidad = curriculum.get('universidad', '')
+    carrera = curriculum.get('carrera', '')
     
-    # Verificar si la malla tiene el formato enriquecido
-    is_enriched = False
-    
-    # Explorar el primer semestre para detectar el formato
-    first_semester_key = next(iter(curriculum['malla_curricular']), None)
-    if first_semester_key and curriculum['malla_curricular'][first_semester_key]:
-        first_subject = curriculum['malla_curricular'][first_semester_key][0]
-        is_enriched = isinstance(first_subject, dict) and 'nombre' in first_subject
-    
-    # Recorrer cada semestre
+    # Cada materia puede venir en formato enriquecido (diccionario) o simple (string)
     for semestre, materias in curriculum['malla_curricular'].items():
-        if is_enriched:
-            # Formato enriquecido
-            for materia in materias:
-                # Añadir semestre a la materia
-                materia_con_semestre = materia.copy()
-                materia_con_semestre['semestre'] = semestre
-                subjects.append(materia_con_semestre)
-        else:
-            # Formato simple (lista de strings)
-            for materia in materias:
-                subjects.append({
-                    'nombre': materia,
-                    'semestre': semestre,
-                    'universidad': curriculum.get('universidad', ''),
-                    'carrera': curriculum.get('carrera', '')
-                })
+        for materia in materias:
+            if isinstance(materia, dict):
+                subjects.append({**materia, 'semestre': semestre, 'universidad': universidad, 'carrera': carrera})
+            else:
+                subjects.append({'nombre': materia, 'semestre': semestre, 'universidad': universidad, 'carrera': carrera})
     
     return subjects
 
@@ -4,17 +4,30 @@ Incluye funciones para migrar, resetear y actualizar datos
 """
 import os
 import json
+import atexit
 import logging
 import datetime
 import sys
-from typing import List, Dict, Any, Tuple, Optional
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Tuple, Optional
 from pathlib import Path
 from tqdm import tqdm
+from bson import ObjectId
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError
 
 # Agregar el directorio raíz al path para importar módulos propios
 sys.path.append(str(Path(__file__).parent.parent))
 from mongodb_connector import MongoDBConnector
 
+# orjson es opcional: si está disponible se usa para leer JSON
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,34 +38,85 @@ logging.basicConfig(
     ]
 )
 
-def find_json_files(base_dir: str, pattern: str = "_enriched.json") -> List[str]:
+# Documentos por llamada a insert_many durante la migración
+BATCH_SIZE = 100
+
+# Hilos de lectura de archivos JSON durante la migración
+READER_WORKERS = 8
+
+# Intentos de verificación tras una migración sin confirmación del servidor
+VERIFY_ATTEMPTS = 5
+
+# Conector compartido por todas las operaciones del proceso
+_connector: Optional[MongoDBConnector] = None
+
+def _close_connector():
+    """Cierra el conector compartido al terminar el proceso"""
+    if _connector is not None:
+        _connector.close()
+
+def get_connector() -> Optional[MongoDBConnector]:
     """
-    Recorre directorios y encuentra archivos JSON enriquecidos
+    Retorna el conector compartido, conectándolo la primera vez (o de nuevo
+    si la conexión anterior se perdió)
+    
+    Returns:
+        Conector conectado o None si no se pudo conectar
+    """
+    global _connector
+    if _connector is None or _connector.get_collection() is None:
+        connector = MongoDBConnector()
+        if not connector.connect():
+            return None
+        if _connector is None:
+            atexit.register(_close_connector)
+        _connector = connector
+    return _connector
+
+def iter_json_files(base_dir: str, pattern: str = "_enriched.json") -> Iterator[str]:
+    """
+    Recorre los directorios de universidades y va devolviendo las rutas de los
+    archivos JSON enriquecidos. Usa os.scandir, que reutiliza el tipo de cada
+    entrada sin un stat() adicional
     
     Args:
         base_dir: Directorio base para buscar
         pattern: Patrón para filtrar archivos (por defecto _enriched.json)
         
     Returns:
-        Lista de rutas de archivos encontrados
+        Iterador de rutas de archivos encontrados
     """
-    json_files = []
     universidad_dirs = os.path.join(base_dir, 'data', 'Universidades')
     
     if not os.path.exists(universidad_dirs):
         logging.error(f"El directorio {universidad_dirs} no existe")
-        return []
+        return
     
     # Recorrer directorios de universidades
-    for universidad in os.listdir(universidad_dirs):
-        uni_path = os.path.join(universidad_dirs, universidad)
-        
-        # Verificar que sea un directorio
-        if os.path.isdir(uni_path):
+    with os.scandir(universidad_dirs) as universidades:
+        for universidad in universidades:
+            # Verificar que sea un directorio
+            if not universidad.is_dir():
+                continue
+            
             # Buscar archivos JSON en el directorio de la universidad
-            for file in os.listdir(uni_path):
-                if file.endswith(pattern):
-                    json_files.append(os.path.join(uni_path, file))
+            with os.scandir(universidad.path) as files:
+                for file in files:
+                    if file.name.endswith(pattern):
+                        yield file.path
+
+def find_json_files(base_dir: str, pattern: str = "_enriched.json") -> List[str]:
+    """
+    Recorre directorios y encuentra archivos JSON enriquecidos
+    
+    Args:
+        base_dir: Directorio base para buscar
+        pattern: Patrón para filtrar archivos (por defecto _enriched.json)
+        
+    Returns:
+        Lista de rutas de archivos encontrados
+    """
+    json_files = list(iter_json_files(base_dir, pattern))
     
     logging.info(f"Se encontraron {len(json_files)} archivos JSON para procesar")
     return json_files
@@ -68,6 +132,10 @@ def read_json_file(file_path: str) -> Optional[Dict]:
         Diccionario con el contenido del archivo o None si hay error
     """
     try:
+        if orjson is not None:
+            with open(file_path, 'rb') as f:
+                return orjson.loads(f.read())
+        
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
             return data
@@ -75,6 +143,29 @@ def read_json_file(file_path: str) -> Optional[Dict]:
         logging.error(f"Error al leer el archivo {file_path}: {e}")
         return None
 
+def _read_json_files(json_files: List[str]) -> Iterator[Tuple[str, Optional[Dict]]]:
+    """
+    Lee archivos JSON en paralelo, devolviéndolos en el orden original. Se
+    mantienen como máximo 2 * BATCH_SIZE lecturas pendientes para acotar la memoria
+    
+    Args:
+        json_files: Lista de rutas a archivos JSON
+        
+    Yields:
+        Tuplas (ruta, contenido o None si hubo error)
+    """
+    with ThreadPoolExecutor(max_workers=READER_WORKERS) as readers:
+        pending = deque()
+        for file_path in json_files:
+            pending.append((file_path, readers.submit(read_json_file, file_path)))
+            if len(pending) >= 2 * BATCH_SIZE:
+                file_path, future = pending.popleft()
+                yield file_path, future.result()
+        
+        while pending:
+            file_path, future = pending.popleft()
+            yield file_path, future.result()
+
 def reset_database() -> int:
     """
     Elimina todos los documentos de la colección configurada en MongoDB
@@ -83,15 +174,15 @@ def reset_database() -> int:
         Número de documentos eliminados
     """
     # Conectar a MongoDB
-    connector = MongoDBConnector()
-    if not connector.connect():
+    connector = get_connector()
+    if connector is None:
         logging.error("No se pudo conectar a MongoDB")
         return 0
         
     try:
         # Obtener base de datos y colección
         collection = connector.get_collection()
-        if not collection:
+        if collection is None:
             logging.error("No se pudo obtener la colección")
             return 0
             
@@ -111,61 +202,154 @@ def reset_database() -> int:
         logging.error(f"Error al eliminar documentos: {e}")
         print(f"\n❌ Error al eliminar documentos: {e}")
         return 0
-    finally:
-        connector.close()
 
-def migrate_to_mongodb(json_files: List[str]) -> Tuple[int, int]:
+def _insert_batch(collection, batch: List[Dict]) -> Tuple[int, int]:
+    """
+    Inserta un lote de documentos con una sola llamada a insert_many. El lote
+    no es ordenado, así que un documento con error no detiene al resto
+    
+    Args:
+        collection: Colección de MongoDB
+        batch: Documentos a insertar
+        
+    Returns:
+        Tupla con (número de documentos insertados, número de errores)
+    """
+    if not batch:
+        return (0, 0)
+    
+    try:
+        result = collection.insert_many(batch, ordered=False)
+        return (len(result.inserted_ids), 0)
+    except BulkWriteError as bwe:
+        failed = len(bwe.details.get('writeErrors', []))
+        logging.error(f"Error al insertar {failed} de {len(batch)} documentos del lote")
+        return (bwe.details.get('nInserted', len(batch) - failed), failed)
+    except Exception as e:
+        logging.error(f"Error al insertar lote de {len(batch)} documentos: {e}")
+        return (0, len(batch))
+
+def _count_existing_ids(collection, ids: List[ObjectId]) -> int:
+    """
+    Cuenta cuántos de los _id indicados existen en la colección
+    
+    Args:
+        collection: Colección de MongoDB
+        ids: Identificadores a buscar
+        
+    Returns:
+        Número de documentos encontrados
+    """
+    found = 0
+    for start in range(0, len(ids), 1000):
+        chunk = ids[start:start + 1000]
+        found += collection.count_documents({"_id": {"$in": chunk}})
+    return found
+
+def _verify_unacknowledged(collection, ids: List[ObjectId]) -> int:
+    """
+    Verifica una migración hecha con w=0. El servidor puede seguir aplicando
+    escrituras recibidas por otras conexiones, así que se reintenta unas
+    veces antes de dar por perdidos los documentos que falten
+    
+    Args:
+        collection: Colección de MongoDB (con confirmación de escritura)
+        ids: Identificadores de los documentos enviados
+        
+    Returns:
+        Número de documentos que llegaron a la colección
+    """
+    found = 0
+    for attempt in range(VERIFY_ATTEMPTS):
+        try:
+            found = _count_existing_ids(collection, ids)
+        except Exception as e:
+            logging.error(f"Error al verificar documentos migrados: {e}")
+        if found >= len(ids):
+            break
+        time.sleep(1)
+    return found
+
+def migrate_to_mongodb(json_files: List[str], unacknowledged: bool = False) -> Tuple[int, int]:
     """
     Migra todos los archivos JSON a MongoDB
     
     Args:
         json_files: Lista de rutas a archivos JSON
+        unacknowledged: Si es True, los lotes se escriben con w=0 (sin esperar
+                        confirmación del servidor) y al final se comprueba por
+                        _id cuántos documentos llegaron realmente
         
     Returns:
         Tupla con (número de documentos insertados, número de errores)
     """
     # Conectar a MongoDB
-    connector = MongoDBConnector()
-    if not connector.connect():
+    connector = get_connector()
+    if connector is None:
         logging.error("No se pudo conectar a MongoDB")
         return (0, 0)
         
-    try:
-        # Contador de documentos insertados
-        inserted_count = 0
-        error_count = 0
+    # Contador de documentos insertados
+    inserted_count = 0
+    error_count = 0
+    
+    collection = connector.get_collection()
+    write_collection = collection
+    sent_ids = []
+    if unacknowledged:
+        write_collection = collection.with_options(write_concern=WriteConcern(w=0))
+    batch = []
+    
+    # Todos los documentos de una migración comparten la marca de importación
+    import_timestamp = datetime.datetime.now()
+    
+    # Los archivos se leen en paralelo mientras un único hilo escritor
+    # inserta el lote anterior; como mucho hay una escritura pendiente
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        pending_write = None
         
-        # Procesar cada archivo JSON con barra de progreso
-        for file_path in tqdm(json_files, desc="Migrando datos a MongoDB"):
-            data = read_json_file(file_path)
-            
+        # Procesar cada archivo JSON con barra de progreso, insertando por lotes
+        for file_path, data in tqdm(_read_json_files(json_files), total=len(json_files),
+                                    desc="Migrando datos a MongoDB"):
             if data:
-                try:
-                    # Agregar metadata sobre el archivo de origen
-                    file_name = os.path.basename(file_path)
-                    data["_source_file"] = file_name
-                    data["_import_timestamp"] = datetime.datetime.now()
-                    
-                    # Insertar en MongoDB
-                    result = connector.insert_one(data)
-                    if result:
-                        inserted_count += 1
-                        logging.debug(f"Documento insertado con ID: {result}")
-                    else:
-                        error_count += 1
-                except Exception as e:
-                    logging.error(f"Error al insertar documento de {file_path}: {e}")
-                    error_count += 1
-        
-        # Resumen final
-        logging.info(f"Migración completada: {inserted_count} documentos insertados")
-        if error_count > 0:
-            logging.warning(f"Hubo {error_count} errores durante la migración")
+                # Agregar metadata sobre el archivo de origen
+                data["_source_file"] = os.path.basename(file_path)
+                data["_import_timestamp"] = import_timestamp
+                if unacknowledged:
+                    # El _id se asigna aquí para poder verificar la escritura
+                    sent_ids.append(data.setdefault("_id", ObjectId()))
+                batch.append(data)
+                
+                if len(batch) >= BATCH_SIZE:
+                    if pending_write is not None:
+                        inserted, errors = pending_write.result()
+                        inserted_count += inserted
+                        error_count += errors
+                    pending_write = writer.submit(_insert_batch, write_collection, batch)
+                    batch = []
         
-        return (inserted_count, error_count)
-    
-    finally:
-        connector.close()
+        if pending_write is not None:
+            inserted, errors = pending_write.result()
+            inserted_count += inserted
+            error_count += errors
+    
+    # Insertar el último lote incompleto
+    inserted, errors = _insert_batch(write_collection, batch)
+    inserted_count += inserted
+    error_count += errors
+    
+    # Sin confirmación del servidor, los conteos reales salen de la verificación
+    if unacknowledged:
+        inserted_count = _verify_unacknowledged(collection, sent_ids)
+        error_count = len(sent_ids) - inserted_count
+    
+    # Resumen final
+    logging.info(f"Migración completada: {inserted_count} documentos insertados")
+    if error_count > 0:
+        logging.warning(f"Hubo {error_count} errores durante la migración")
+    
+    return (inserted_count, error_count)
+
 
 def update_document(file_path: str) -> bool:
     """
@@ -182,8 +366,8 @@ def update_document(file_path: str) -> bool:
         return False
         
     # Conectar a MongoDB
-    connector = MongoDBConnector()
-    if not connector.connect():
+    connector = get_connector()
+    if connector is None:
         logging.error("No se pudo conectar a MongoDB")
         return False
         
@@ -233,12 +417,102 @@ def update_document(file_path: str) -> bool:
         logging.error(f"Error al actualizar documento de {file_path}: {e}")
         return False
     
-    finally:
-        connector.close()
 
-def reset_and_migrate():
+def _upsert_batch(collection, operations: List[UpdateOne]) -> Tuple[int, int]:
+    """
+    Aplica un lote de upserts con una sola llamada a bulk_write no ordenada
+    
+    Args:
+        collection: Colección de MongoDB
+        operations: Operaciones UpdateOne a aplicar
+        
+    Returns:
+        Tupla con (número de documentos actualizados o insertados, número de errores)
+    """
+    if not operations:
+        return (0, 0)
+    
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return (result.matched_count + result.upserted_count, 0)
+    except BulkWriteError as bwe:
+        failed = len(bwe.details.get('writeErrors', []))
+        logging.error(f"Error al actualizar {failed} de {len(operations)} documentos del lote")
+        return (bwe.details.get('nMatched', 0) + bwe.details.get('nUpserted', 0), failed)
+    except Exception as e:
+        logging.error(f"Error al actualizar lote de {len(operations)} documentos: {e}")
+        return (0, len(operations))
+
+def bulk_update_documents(file_paths: List[str]) -> Tuple[int, int]:
+    """
+    Actualiza (o inserta si no existen) los documentos de varios archivos JSON,
+    identificados por universidad y carrera, con upserts agrupados en lotes
+    
+    Args:
+        file_paths: Rutas a los archivos JSON
+        
+    Returns:
+        Tupla con (número de documentos actualizados o insertados, número de errores)
+    """
+    # Conectar a MongoDB
+    connector = get_connector()
+    if connector is None:
+        logging.error("No se pudo conectar a MongoDB")
+        return (0, 0)
+    
+    collection = connector.get_collection()
+    updated_count = 0
+    error_count = 0
+    operations = []
+    now = datetime.datetime.now()
+    
+    for file_path, data in tqdm(_read_json_files(file_paths), total=len(file_paths),
+                                desc="Actualizando documentos"):
+        if not data:
+            error_count += 1
+            continue
+        
+        universidad = data.get("universidad")
+        carrera = data.get("carrera")
+        if not universidad or not carrera:
+            logging.error(f"El archivo {file_path} no contiene universidad o carrera")
+            error_count += 1
+            continue
+        
+        # Agregar metadata sobre el archivo de origen
+        data["_source_file"] = os.path.basename(file_path)
+        data["_import_timestamp"] = now
+        data["_updated_timestamp"] = now
+        
+        operations.append(UpdateOne(
+            {"universidad": universidad, "carrera": carrera},
+            {"$set": data},
+            upsert=True
+        ))
+        
+        if len(operations) >= BATCH_SIZE:
+            updated, errors = _upsert_batch(collection, operations)
+            updated_count += updated
+            error_count += errors
+            operations = []
+    
+    # Aplicar el último lote incompleto
+    updated, errors = _upsert_batch(collection, operations)
+    updated_count += updated
+    error_count += errors
+    
+    logging.info(f"Actualización completada: {updated_count} documentos actualizados o insertados")
+    if error_count > 0:
+        logging.warning(f"Hubo {error_count} errores durante la actualización")
+    
+    return (updated_count, error_count)
+
+def reset_and_migrate(unacknowledged: bool = False):
     """
     Función principal para resetear y migrar datos a MongoDB
+    
+    Args:
+        unacknowledged: Si es True, se migra con escrituras w=0 (ver migrate_to_mongodb)
     """
     logging.info("Iniciando reseteo y migración completa de datos a MongoDB local")
     
@@ -271,7 +545,7 @@ def reset_and_migrate():
         return
     
     # Paso 3: Migrar a MongoDB
-    inserted, errors = migrate_to_mongodb(json_files)
+    inserted, errors = migrate_to_mongodb(json_files, unacknowledged)
     
     # Paso 4: Mostrar resumen
     print("\n" + "="*50)
@@ -284,9 +558,12 @@ def reset_and_migrate():
     print(f"Puedes verificar los datos en MongoDB Compass")
     print("="*50)
 
-def migrate_only():
+def migrate_only(unacknowledged: bool = False):
     """
     Función para migrar datos sin resetear la base de datos
+    
+    Args:
+        unacknowledged: Si es True, se migra con escrituras w=0 (ver migrate_to_mongodb)
     """
     logging.info("Iniciando migración de datos a MongoDB local")
     
@@ -299,7 +576,7 @@ def migrate_only():
         return
     
     # Migrar a MongoDB
-    inserted, errors = migrate_to_mongodb(json_files)
+    inserted, errors = migrate_to_mongodb(json_files, unacknowledged)
     
     # Mostrar resumen
     print("\n" + "="*50)
@@ -328,6 +605,31 @@ def update_specific_file(file_path: str):
     else:
         print("❌ Error al actualizar el documento")
 
+def update_specific_files(file_paths: List[str]):
+    """
+    Actualiza varios archivos en la base de datos con escrituras por lotes
+    
+    Args:
+        file_paths: Rutas a los archivos a actualizar
+    """
+    existing = [file_path for file_path in file_paths if os.path.exists(file_path)]
+    for file_path in file_paths:
+        if file_path not in existing:
+            print(f"Error: No se encontró el archivo {file_path}")
+    
+    if not existing:
+        return
+    
+    print(f"Actualizando {len(existing)} documentos...")
+    updated, errors = bulk_update_documents(existing)
+    
+    print("\n" + "="*50)
+    print(f"ACTUALIZACIÓN COMPLETADA")
+    print(f"- Archivos procesados: {len(existing)}")
+    print(f"- Documentos actualizados o insertados: {updated}")
+    print(f"- Errores: {errors}")
+    print("="*50)
+
 if __name__ == "__main__":
     import argparse
     
@@ -343,19 +645,30 @@ if __name__ == "__main__":
     # Comando para solo migrar
     migrate_parser = subparsers.add_parser("migrate", help="Migrar datos sin resetear")
     
+    # Escrituras sin confirmación para reset y migrate
+    for command_parser in (reset_parser, migrate_parser):
+        command_parser.add_argument("--unacknowledged", action="store_true",
+                                    help="Insertar con w=0 y verificar los documentos al final")
+    
     # Comando para actualizar un archivo específico
     update_parser = subparsers.add_parser("update", help="Actualizar un archivo específico")
     update_parser.add_argument("file", help="Ruta al archivo JSON a actualizar")
     
+    # Comando para actualizar varios archivos por lotes
+    update_many_parser = subparsers.add_parser("update-many", help="Actualizar varios archivos por lotes")
+    update_many_parser.add_argument("files", nargs="+", help="Rutas a los archivos JSON a actualizar")
+    
     # Parsear argumentos
     args = parser.parse_args()
     
     # Ejecutar el comando correspondiente
     if args.command == "reset":
-        reset_and_migrate()
+        reset_and_migrate(args.unacknowledged)
     elif args.command == "migrate":
-        migrate_only()
+        migrate_only(args.unacknowledged)
     elif args.command == "update" and hasattr(args, "file"):
         update_specific_file(args.file)
+    elif args.command == "update-many":
+        update_specific_files(args.files)
     else:
         parser.print_help()
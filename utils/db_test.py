@@ -1,6 +1,7 @@
 """
 Script simple para probar la conexión a MongoDB
 """
+from typing import Optional
 from pymongo import MongoClient
 from mongodb_connector import MongoDBConnector
 import os
@@ -11,12 +12,16 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-def test_direct_connection():
+# Cliente compartido por las pruebas directas; MongoClient no abre conexiones
+# hasta la primera operación
+_shared_client = MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=2000)
+
+def test_direct_connection(client: Optional[MongoClient] = None):
     """Prueba conexión directa a MongoDB sin usar el conector personalizado"""
     print("\n=== PRUEBA DE CONEXIÓN DIRECTA A MONGODB ===")
     try:
         # Intentar conexión directa
-        client = MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=2000)
+        client = client or _shared_client
         client.admin.command('ping')
         print("✅ Conexión directa exitosa")
         
@@ -34,7 +39,8 @@ def test_direct_connection():
             # Verificar contenido en la colección
             collection_name = "mallas_curriculares"
             if collection_name in collections:
-                count = db[collection_name].count_documents({})
+                # Conteo desde los metadatos de la colección, sin recorrerla
+                count = db[collection_name].estimated_document_count()
                 print(f"Documentos en {collection_name}: {count}")
                 
                 # Mostrar ejemplo
@@ -81,7 +87,7 @@ def test_connector():
                 
                 # Contar documentos
                 try:
-                    count = collection.count_documents({})
+                    count = collection.estimated_document_count()
                     print(f"✅ Documentos contados correctamente: {count}")
                 except Exception as e:
                     print(f"❌ Error al contar documentos: {e}")
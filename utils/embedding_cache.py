@@ -0,0 +1,117 @@
+"""
+Caché persistente de embeddings por texto, respaldada por SQLite
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite limita la cantidad de parámetros por consulta
+_MAX_QUERY_PARAMS = 900
+
+# Instancias abiertas por ruta de base de datos
+_cache_instances: Dict[str, "EmbeddingCache"] = {}
+_cache_instances_lock = threading.Lock()
+
+def text_hash(text: str) -> bytes:
+    """
+    Calcula la clave de caché de un texto.
+
+    Args:
+        text: Texto a convertir en clave
+
+    Returns:
+        Digest SHA-256 del texto en UTF-8
+    """
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+class EmbeddingCache:
+    """
+    Almacena vectores de embeddings indexados por (modelo, hash del texto), de
+    forma que un mismo texto solo se codifica una vez entre ejecuciones
+    """
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS emb ("
+                "model TEXT NOT NULL, hash BLOB NOT NULL, vec BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+
+    def get_many(self, model_name: str, hashes: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Busca los vectores guardados para un conjunto de textos.
+
+        Args:
+            model_name: Nombre del modelo que generó los embeddings
+            hashes: Claves de los textos (ver text_hash)
+
+        Returns:
+            Diccionario hash -> vector para las claves encontradas
+        """
+        keys = list(dict.fromkeys(hashes))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _MAX_QUERY_PARAMS):
+                chunk = keys[start:start + _MAX_QUERY_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM emb WHERE model = ? AND hash IN ({placeholders})",
+                    [model_name, *chunk]
+                )
+                for key, vec in rows:
+                    found[bytes(key)] = np.frombuffer(vec, dtype=np.float32)
+        return found
+
+    def put_many(self, model_name: str, hashes: List[bytes], vectors: np.ndarray) -> None:
+        """
+        Guarda vectores nuevos. Las claves ya existentes no se sobrescriben.
+
+        Args:
+            model_name: Nombre del modelo que generó los embeddings
+            hashes: Claves de los textos, en el mismo orden que vectors
+            vectors: Matriz de embeddings (n, dimensión)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rows = [(model_name, key, vec.tobytes()) for key, vec in zip(hashes, vectors)]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO emb (model, hash, vec) VALUES (?, ?, ?)", rows
+            )
+
+def get_embedding_cache(db_path: Optional[str] = None) -> Optional[EmbeddingCache]:
+    """
+    Obtiene la caché de embeddings, abriéndola la primera vez.
+
+    Args:
+        db_path: Ruta del archivo SQLite. Si es None, se usa el directorio de
+                 caché de modelos
+
+    Returns:
+        Instancia de EmbeddingCache o None si no se pudo abrir
+    """
+    if db_path is None:
+        cache_dir = Path(os.getenv("TEMP", ".")) / "model_cache"
+        db_path = cache_dir / "embeddings_cache.sqlite"
+    db_path = str(db_path)
+
+    with _cache_instances_lock:
+        if db_path not in _cache_instances:
+            try:
+                os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+                _cache_instances[db_path] = EmbeddingCache(db_path)
+            except Exception as e:
+                logger.error(f"Error al abrir caché de embeddings {db_path}: {e}")
+                return None
+        return _cache_instances[db_path]
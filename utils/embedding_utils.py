@@ -5,10 +5,11 @@ Utilidades para trabajar con embeddings de texto
 import numpy as np
 from typing import List, Dict, Any, Union
 import os
-import pickle
-from pathlib import Path
+import atexit
 import logging
 
+from .embedding_cache import get_embedding_cache, text_hash
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,6 +26,14 @@ except ImportError:
 # Cache para el modelo de embeddings
 _model_cache = {}
 
+# Pools multiproceso por modelo, para lotes grandes en CPU donde el GIL
+# serializa la codificación. A partir de cuántos textos se usan (0 = nunca)
+_pool_cache = {}
+MULTIPROCESS_MIN_DOCS = int(os.getenv("EMBEDDING_MULTIPROCESS_MIN_DOCS", "2000"))
+
+# Textos por lote al codificar
+ENCODE_BATCH_SIZE = 64
+
 def get_embedding_model(model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
     """
     Obtiene un modelo de embeddings, cargándolo desde caché si ya existe.
@@ -48,6 +57,61 @@ def get_embedding_model(model_name: str = "paraphrase-multilingual-MiniLM-L12-v2
             
     return _model_cache[model_name]
 
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    Normaliza cada fila de una matriz a norma L2 unitaria, en float32. Las
+    filas nulas se dejan en cero para que su similitud con cualquier otra sea 0.
+    
+    Args:
+        matrix: Matriz de embeddings (n, dimensión)
+        
+    Returns:
+        Matriz con las filas normalizadas
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _stop_pools():
+    """Detiene los pools multiproceso abiertos al terminar el proceso"""
+    for pool in _pool_cache.values():
+        try:
+            SentenceTransformer.stop_multi_process_pool(pool)
+        except Exception as e:
+            logger.error(f"Error al detener pool de embeddings: {e}")
+    _pool_cache.clear()
+
+def _encode(model, model_name: str, texts: List[str]) -> np.ndarray:
+    """
+    Codifica una lista de textos, repartiéndola entre varios procesos cuando
+    es lo bastante grande y hay más de un núcleo disponible. Los vectores se
+    devuelven normalizados (norma 1), así que el coseno es un producto escalar.
+    
+    Args:
+        model: Modelo de sentence-transformers ya cargado
+        model_name: Nombre del modelo (clave del pool)
+        texts: Textos a codificar
+        
+    Returns:
+        Matriz de embeddings normalizados
+    """
+    if 0 < MULTIPROCESS_MIN_DOCS <= len(texts) and (os.cpu_count() or 1) > 1:
+        try:
+            if model_name not in _pool_cache:
+                if not _pool_cache:
+                    atexit.register(_stop_pools)
+                _pool_cache[model_name] = model.start_multi_process_pool()
+            embeddings = model.encode_multi_process(texts, _pool_cache[model_name],
+                                                    batch_size=ENCODE_BATCH_SIZE)
+            # encode_multi_process no admite normalize_embeddings en todas las versiones
+            return l2_normalize(embeddings)
+        except Exception as e:
+            logger.error(f"Error al codificar con varios procesos, se usa un solo proceso: {e}")
+    
+    return model.encode(texts, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True,
+                        normalize_embeddings=True, show_progress_bar=False)
+
 def get_embedding(text: str, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2") -> np.ndarray:
     """
     Obtiene el embedding de un texto usando un modelo de sentence-transformers.
@@ -72,13 +136,16 @@ def get_embedding(text: str, model_name: str = "paraphrase-multilingual-MiniLM-L
         logger.error(f"Error al generar embedding: {e}")
         return np.zeros(384)
 
-def calculate_cosine_similarity(embedding1: np.ndarray, embedding2: np.ndarray) -> float:
+def calculate_cosine_similarity(embedding1: np.ndarray, embedding2: np.ndarray,
+                                assume_normalized: bool = False) -> float:
     """
     Calcula la similitud del coseno entre dos embeddings.
     
     Args:
         embedding1: Primer vector de embedding
         embedding2: Segundo vector de embedding
+        assume_normalized: Si es True, los vectores ya tienen norma 1 (como los
+                           de batch_embed_documents) y basta el producto escalar
         
     Returns:
         Similitud del coseno (entre 0 y 1)
@@ -87,6 +154,9 @@ def calculate_cosine_similarity(embedding1: np.ndarray, embedding2: np.ndarray)
     if embedding1 is None or embedding2 is None:
         return 0.0
     
+    if assume_normalized:
+        return float(np.dot(embedding1, embedding2))
+    
     # Verificar si algún vector es de ceros
     if np.all(embedding1 == 0) or np.all(embedding2 == 0):
         return 0.0
@@ -102,62 +172,80 @@ def calculate_cosine_similarity(embedding1: np.ndarray, embedding2: np.ndarray)
         logger.error(f"Error al calcular similitud de coseno: {e}")
         return 0.0
 
+def batch_cosine_similarity(A: np.ndarray, B: np.ndarray,
+                            assume_normalized: bool = False) -> np.ndarray:
+    """
+    Calcula la similitud del coseno entre todas las filas de A y todas las de B
+    con una sola multiplicación de matrices en float32.
+    
+    Args:
+        A: Matriz de embeddings (m, dimensión)
+        B: Matriz de embeddings (n, dimensión)
+        assume_normalized: Si es True, las filas ya tienen norma 1 (como las
+                           de batch_embed_documents) y no se vuelven a normalizar
+        
+    Returns:
+        Matriz de similitudes (m, n). Las filas nulas tienen similitud 0
+    """
+    if assume_normalized:
+        A = np.asarray(A, dtype=np.float32)
+        B = np.asarray(B, dtype=np.float32)
+    else:
+        A = l2_normalize(A)
+        B = l2_normalize(B)
+    return A @ B.T
+
 def batch_embed_documents(documents: List[str], 
                          model_name: str = "paraphrase-multilingual-MiniLM-L12-v2", 
-                         use_cache: bool = True, 
-                         cache_file: str = None) -> np.ndarray:
+                         use_cache: bool = True) -> np.ndarray:
     """
-    Convierte una lista de documentos a embeddings de forma eficiente.
+    Convierte una lista de documentos a embeddings normalizados de forma eficiente.
     
     Args:
         documents: Lista de textos a convertir en embeddings
         model_name: Nombre del modelo de sentence-transformers
-        use_cache: Si es True, intenta cargar/guardar embeddings desde/en caché
-        cache_file: Nombre del archivo de caché (opcional)
+        use_cache: Si es True, intenta cargar/guardar los embeddings de cada
+                   texto desde/en la caché SQLite
         
     Returns:
         Matriz de embeddings (n_documentos, dimensión_embedding)
     """
     if not documents:
         return np.zeros((0, 384))
+    
+    # Recuperar de la caché por texto los embeddings ya calculados. La clave
+    # distingue los vectores normalizados de los guardados antes sin normalizar
+    text_cache = get_embedding_cache() if use_cache else None
+    cache_key = f"{model_name}:norm"
+    hashes = [text_hash(doc) for doc in documents] if text_cache is not None else None
+    found = text_cache.get_many(cache_key, hashes) if text_cache is not None else {}
+    missing = [i for i, doc_hash in enumerate(hashes) if doc_hash not in found] if hashes else list(range(len(documents)))
+    
+    # Generar solo los embeddings que faltan
+    new_embeddings = None
+    if missing:
+        model = get_embedding_model(model_name)
+        if model is None:
+            # Si no hay modelo, devolver matriz de ceros
+            return np.zeros((len(documents), 384))
         
-    # Configurar ruta de caché
-    if cache_file is None and use_cache:
-        cache_dir = Path(os.getenv("TEMP", ".")) / "model_cache"
-        os.makedirs(cache_dir, exist_ok=True)
-        cache_file = cache_dir / f"embeddings_cache_{model_name.replace('-', '_')}.pkl"
-    
-    # Intentar cargar desde caché
-    embeddings = None
-    if use_cache and cache_file and os.path.exists(cache_file):
         try:
-            with open(cache_file, 'rb') as f:
-                cache_data = pickle.load(f)
-                if 'documents' in cache_data and 'embeddings' in cache_data:
-                    # Verificar si los documentos coinciden
-                    if cache_data['documents'] == documents:
-                        return cache_data['embeddings']
+            new_embeddings = _encode(model, model_name, [documents[i] for i in missing])
         except Exception as e:
-            logger.error(f"Error al cargar caché: {e}")
-    
-    # Generar embeddings
-    model = get_embedding_model(model_name)
-    if model is None:
-        # Si no hay modelo, devolver matriz de ceros
-        return np.zeros((len(documents), 384))
+            logger.error(f"Error al generar embeddings: {e}")
+            return np.zeros((len(documents), 384))
         
-    try:
-        embeddings = model.encode(documents)
-    
-        # Guardar en caché
-        if use_cache and cache_file:
+        if text_cache is not None:
+            missing_hashes = [hashes[i] for i in missing]
             try:
-                with open(cache_file, 'wb') as f:
-                    pickle.dump({'documents': documents, 'embeddings': embeddings}, f)
+                text_cache.put_many(cache_key, missing_hashes, new_embeddings)
             except Exception as e:
-                logger.error(f"Error al guardar caché: {e}")
+                logger.error(f"Error al guardar caché de embeddings: {e}")
+            found.update(zip(missing_hashes, np.asarray(new_embeddings, dtype=np.float32)))
     
-        return embeddings
-    except Exception as e:
-        logger.error(f"Error al generar embeddings: {e}")
-        return np.zeros((len(documents), 384))
+    if hashes is not None:
+        embeddings = np.vstack([found[doc_hash] for doc_hash in hashes])
+    else:
+        embeddings = new_embeddings
+    
+    return embeddings
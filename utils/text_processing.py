@@ -3,9 +3,48 @@ Utilidades para procesamiento de texto y análisis de similitud
 """
 
 import re
+import math
 import unicodedata
-import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from collections import Counter
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+# Tabla de tildes habituales en español (el texto ya viene en minúsculas)
+_ACCENT_TABLE = str.maketrans("áéíóúüñàèìòùâêîôû", "aeiouunaeiouaeiou")
+
+# Marcas diacríticas combinables (U+0300-U+036F) que deja la descomposición NFD
+_COMBINING_MARKS_TABLE = dict.fromkeys(range(0x300, 0x370))
+
+# Palabras del texto ya normalizado: solo letras sin tildes
+_WORD_RE = re.compile(r'[a-z]+')
+
+# Abreviaturas comunes y su forma completa
+_ABBR_MAP = {
+    "ing.": "ingenieria",
+    "mat.": "matematica",
+    "prog.": "programacion",
+    "sist.": "sistemas",
+    "comp.": "computacion",
+    "lab.": "laboratorio",
+    "calc.": "calculo",
+    "est.": "estadistica",
+    "adm.": "administracion",
+    "econ.": "economia",
+    "prac.": "practica",
+    "tec.": "tecnologia",
+    "alg.": "algoritmos"
+}
+# Tras el punto no hay límite de palabra que exigir, por eso solo se ancla al inicio
+_ABBR_RE = re.compile(r'\b(' + '|'.join(map(re.escape, _ABBR_MAP)) + r')')
+
+# Lista básica de stopwords en español
+_STOPWORDS = frozenset([
+    'el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas', 'y', 'o', 'de',
+    'del', 'a', 'en', 'por', 'para', 'con', 'sin', 'sobre', 'entre',
+    'que', 'se', 'su', 'sus', 'como', 'pero', 'mas', 'si', 'no',
+    'al', 'este', 'esta', 'estos', 'estas', 'aquel', 'aquella',
+    'aquellos', 'aquellas'
+])
 
 def normalize_text(text: str) -> str:
     """
@@ -21,41 +60,53 @@ def normalize_text(text: str) -> str:
     if not text or not isinstance(text, str):
         return ""
     
+    return ' '.join(_normalized_tokens(text))
+
+def _expand_text(text: str) -> str:
+    """Pasa a minúsculas, quita tildes y sustituye abreviaturas"""
     # Convertir a minúsculas
     text = text.lower()
     
-    # Eliminar tildes
-    text = ''.join(c for c in unicodedata.normalize('NFD', text)
-                  if unicodedata.category(c) != 'Mn')
+    # Eliminar tildes. Los textos ya ASCII no tienen nada que quitar; en el
+    # resto la tabla cubre los casos comunes y solo si quedan caracteres no
+    # ASCII se recurre a la descomposición NFD, quitando las marcas con translate
+    if not text.isascii():
+        text = text.translate(_ACCENT_TABLE)
+        if not text.isascii():
+            text = unicodedata.normalize('NFD', text).translate(_COMBINING_MARKS_TABLE)
     
     # Sustituir abreviaturas comunes
-    abreviaturas = {
-        "ing.": "ingenieria",
-        "mat.": "matematica",
-        "prog.": "programacion",
-        "sist.": "sistemas",
-        "comp.": "computacion",
-        "lab.": "laboratorio",
-        "calc.": "calculo",
-        "est.": "estadistica",
-        "adm.": "administracion",
-        "econ.": "economia",
-        "prac.": "practica",
-        "tec.": "tecnologia",
-        "prog.": "programacion",
-        "alg.": "algoritmos"
-    }
-    
-    for abrev, completo in abreviaturas.items():
-        text = re.sub(rf'\b{abrev}\b', completo, text)
-    
-    # Eliminar caracteres especiales y números
-    text = re.sub(r'[^a-z\s]', ' ', text)
-    
-    # Eliminar espacios múltiples
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
+    return _ABBR_RE.sub(lambda m: _ABBR_MAP[m.group(1)], text)
+
+@lru_cache(maxsize=100_000)
+def _normalized_tokens(text: str) -> Tuple[str, ...]:
+    """
+    Palabras del texto normalizado, memorizadas por texto de entrada. Extraer
+    las secuencias de letras equivale a eliminar caracteres especiales y
+    números y partir por espacios, pero en una sola pasada
+    """
+    return tuple(_WORD_RE.findall(_expand_text(text)))
+
+def _tokenize_normalized(text: str, stopwords: Optional[frozenset] = _STOPWORDS,
+                         min_len: int = 1) -> Iterator[str]:
+    """
+    Recorre las palabras normalizadas de un texto aplicando en la misma pasada
+    el filtro de stopwords y de longitud mínima.
+    
+    Args:
+        text: Texto a dividir en palabras
+        stopwords: Palabras a descartar. Si es vacío o None, no se descarta ninguna
+        min_len: Longitud mínima de las palabras devueltas
+        
+    Returns:
+        Iterador de palabras normalizadas
+    """
+    if not text or not isinstance(text, str):
+        return
+    
+    for word in _normalized_tokens(text):
+        if len(word) >= min_len and not (stopwords and word in stopwords):
+            yield word
 
 def remove_stopwords(text: str, stopwords: List[str] = None) -> str:
     """
@@ -68,13 +119,7 @@ def remove_stopwords(text: str, stopwords: List[str] = None) -> str:
     Returns:
         Texto sin stopwords
     """
-    if not stopwords:
-        # Lista básica de stopwords en español
-        stopwords = ['el', 'la', 'los', 'las', 'un', 'una', 'unos', 'unas', 'y', 'o', 'de', 
-                     'del', 'a', 'en', 'por', 'para', 'con', 'sin', 'sobre', 'entre', 
-                     'que', 'se', 'su', 'sus', 'como', 'pero', 'mas', 'si', 'no', 
-                     'al', 'este', 'esta', 'estos', 'estas', 'aquel', 'aquella', 
-                     'aquellos', 'aquellas']
+    stopwords = frozenset(stopwords) if stopwords else _STOPWORDS
     
     words = text.split()
     filtered_words = [word for word in words if word.lower() not in stopwords]
@@ -91,24 +136,19 @@ def extract_keywords(text: str, n: int = 5) -> List[str]:
     Returns:
         Lista de palabras clave
     """
-    # Normalizar texto
-    text = normalize_text(text)
-    
-    # Eliminar stopwords
-    text = remove_stopwords(text)
-    
-    # Contar frecuencia de palabras
-    words = text.split()
-    word_freq = {}
-    for word in words:
-        if len(word) > 3:  # Ignorar palabras muy cortas
-            word_freq[word] = word_freq.get(word, 0) + 1
+    if not isinstance(text, str):
+        return []
     
-    # Ordenar por frecuencia
-    sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+    return list(_extract_keywords_cached(text, n))
+
+@lru_cache(maxsize=100_000)
+def _extract_keywords_cached(text: str, n: int) -> Tuple[str, ...]:
+    """Extracción de extract_keywords, memorizada por (texto, n)"""
+    # Contar frecuencia de palabras sin stopwords, ignorando las muy cortas
+    word_freq = Counter(_tokenize_normalized(text, min_len=4))
     
     # Devolver las n palabras más frecuentes
-    return [word for word, _ in sorted_words[:n]]
+    return tuple(word for word, _ in word_freq.most_common(n))
 
 def calculate_similarity(text1: str, text2: str, method: str = "jaccard") -> float:
     """
@@ -122,56 +162,35 @@ def calculate_similarity(text1: str, text2: str, method: str = "jaccard") -> flo
     Returns:
         Valor de similitud entre 0 y 1
     """
-    # Normalizar textos
-    text1 = normalize_text(text1)
-    text2 = normalize_text(text2)
+    # Crear conjuntos de palabras normalizadas (sin filtrar stopwords)
+    set1 = set(_tokenize_normalized(text1, stopwords=None))
+    set2 = set(_tokenize_normalized(text2, stopwords=None))
     
     # Si alguno está vacío, la similitud es 0
-    if not text1 or not text2:
+    if not set1 or not set2:
         return 0.0
     
-    # Crear conjuntos de palabras
-    set1 = set(text1.split())
-    set2 = set(text2.split())
+    # Tamaño de la intersección, común a todos los métodos
+    inter = len(set1 & set2)
     
     if method == "jaccard":
         # Índice de Jaccard: tamaño de la intersección / tamaño de la unión
-        union = len(set1.union(set2))
+        union = len(set1) + len(set2) - inter
         if union == 0:
             return 0.0
-        return len(set1.intersection(set2)) / union
+        return inter / union
     
     elif method == "overlap":
         # Coeficiente de superposición: tamaño de la intersección / tamaño del conjunto más pequeño
         min_size = min(len(set1), len(set2))
         if min_size == 0:
             return 0.0
-        return len(set1.intersection(set2)) / min_size
+        return inter / min_size
     
     elif method == "cosine":
-        # Similitud del coseno básica (sin TF-IDF)
-        # Crear un vocabulario conjunto
-        vocabulary = sorted(set1.union(set2))
-        
-        # Crear vectores de frecuencia
-        vec1 = np.zeros(len(vocabulary))
-        vec2 = np.zeros(len(vocabulary))
-        
-        for i, word in enumerate(vocabulary):
-            if word in set1:
-                vec1[i] = 1
-            if word in set2:
-                vec2[i] = 1
-        
-        # Calcular similitud del coseno
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
-        
-        return dot_product / (norm1 * norm2)
+        # Similitud del coseno básica (sin TF-IDF) sobre vectores binarios:
+        # |A ∩ B| / sqrt(|A| * |B|)
+        return inter / math.sqrt(len(set1) * len(set2))
     
     else:
         raise ValueError(f"Método de similitud '{method}' no soportado")
@@ -2,17 +2,58 @@
 Utilidades para visualización de datos y resultados
 """
 
+from functools import lru_cache
+from io import BytesIO
+import matplotlib
+# Las figuras solo se renderizan en el servidor para Streamlit: backend sin interfaz
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
 import seaborn as sns
 import numpy as np
 import pandas as pd
 import streamlit as st
 from typing import List, Dict, Any, Optional, Union
 
+try:
+    from sklearn.decomposition import TruncatedSVD
+except ImportError:
+    print("Error: No se pudo importar TruncatedSVD de sklearn.decomposition")
+    print("Por favor, instale scikit-learn con: pip install scikit-learn>=1.3.0")
+    TruncatedSVD = None
+
+# Máximo de puntos para anotar cada uno con su nombre en los gráficos de clusters
+MAX_ANNOT = 200
+
+# A partir de cuántos puntos se rasteriza el scatter de clusters
+RASTERIZE_MIN_POINTS = 1000
+
+# Máximo de etiquetas por eje en los mapas de calor grandes
+MAX_TICK_LABELS = 30
+
+def _subplots(figsize=None, subplot_kw=None):
+    """
+    Equivalente a plt.subplots con una Figure independiente de pyplot: la
+    figura no entra en el registro global de figuras y se libera en cuanto
+    deja de usarse, sin necesidad de plt.close
+    """
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots(subplot_kw=subplot_kw)
+    return fig, ax
+
+def _figure_png(fig: Figure) -> bytes:
+    """Renderiza una figura a PNG y devuelve los bytes"""
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
 def create_similarity_heatmap(similarity_matrix: np.ndarray, 
                              labels: List[str] = None, 
                              title: str = "Matriz de Similitud",
-                             cmap: str = "viridis") -> plt.Figure:
+                             cmap: str = "viridis",
+                             annot: Optional[bool] = None,
+                             as_png: bool = False) -> Union[plt.Figure, bytes]:
     """
     Crea un mapa de calor para visualizar similitudes entre elementos
     
@@ -21,29 +62,99 @@ def create_similarity_heatmap(similarity_matrix: np.ndarray,
         labels: Etiquetas para los ejes (opcional)
         title: Título del gráfico
         cmap: Mapa de colores a utilizar
+        annot: Si se escriben los valores en cada celda. Por defecto solo se
+               hace hasta 20 elementos, donde el texto sigue siendo legible
+        as_png: Si es True devuelve la imagen PNG ya renderizada (para st.image),
+                memorizada entre reruns
         
     Returns:
-        Objeto Figure de matplotlib
+        Objeto Figure de matplotlib, o bytes PNG si as_png es True
     """
+    # Matriz contigua en float32, el formato que matplotlib dibuja sin copias extra
+    similarity_matrix = np.ascontiguousarray(similarity_matrix, dtype=np.float32)
+    if annot is None:
+        annot = similarity_matrix.shape[0] <= 20
+    
+    args = (similarity_matrix.tobytes(), similarity_matrix.shape,
+            tuple(labels) if labels else None, title, cmap, annot)
+    if as_png:
+        return _similarity_heatmap_png(*args)
+    return _similarity_heatmap_figure(*args)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _similarity_heatmap_png(matrix_bytes: bytes, shape: tuple, labels: Optional[tuple],
+                            title: str, cmap: str, annot: bool) -> bytes:
+    """PNG de create_similarity_heatmap, memorizado por el contenido de sus argumentos"""
+    return _figure_png(_similarity_heatmap_figure(matrix_bytes, shape, labels, title, cmap, annot))
+
+def _similarity_heatmap_figure(matrix_bytes: bytes, shape: tuple, labels: Optional[tuple],
+                               title: str, cmap: str, annot: bool) -> plt.Figure:
+    """Figura de create_similarity_heatmap"""
+    similarity_matrix = np.frombuffer(matrix_bytes, dtype=np.float32).reshape(shape)
+    labels = list(labels) if labels else None
+    n = shape[0]
+    
     # Configurar figura
-    fig, ax = plt.subplots(figsize=(10, 8))
-    
-    # Crear heatmap
-    sns.heatmap(similarity_matrix, 
-                annot=True, 
-                cmap=cmap, 
-                square=True,
-                linewidths=.5,
-                xticklabels=labels,
-                yticklabels=labels,
-                ax=ax)
+    fig, ax = _subplots(figsize=(10, 8))
+    
+    if n <= 20 or annot:
+        # Crear heatmap. Con muchos elementos los bordes de celda no se distinguen
+        # y solo añaden trabajo de dibujado
+        sns.heatmap(similarity_matrix, 
+                    annot=annot, 
+                    cmap=cmap, 
+                    square=True,
+                    linewidths=0 if n > 50 else .5,
+                    xticklabels=labels,
+                    yticklabels=labels,
+                    ax=ax)
+    else:
+        # Matrices grandes sin anotaciones: una sola imagen en lugar de una
+        # celda por par de elementos
+        im = ax.imshow(similarity_matrix, cmap=cmap, aspect='equal', interpolation='nearest')
+        fig.colorbar(im, ax=ax)
+        if labels:
+            # Solo una de cada k etiquetas: con todas se solapan y su dibujado
+            # domina el tiempo de renderizado
+            ticks = np.arange(0, n, max(1, -(-n // MAX_TICK_LABELS)))
+            tick_labels = [labels[i] for i in ticks]
+            ax.set_xticks(ticks)
+            ax.set_xticklabels(tick_labels, rotation=90)
+            ax.set_yticks(ticks)
+            ax.set_yticklabels(tick_labels)
     
     # Configurar título y etiquetas
-    plt.title(title, fontsize=14)
-    plt.tight_layout()
+    ax.set_title(title, fontsize=14)
+    fig.tight_layout()
     
     return fig
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def _pca_2d(embeddings_bytes: bytes, shape: tuple, dtype: str) -> np.ndarray:
+    """
+    Proyección PCA a 2D, memorizada por el contenido de los embeddings. Se
+    calcula con SVD truncada aleatorizada sobre los datos centrados, que para
+    2 componentes evita la SVD completa
+    
+    Args:
+        embeddings_bytes: Bytes de la matriz de embeddings (orden C)
+        shape: Forma de la matriz
+        dtype: Tipo de datos de la matriz (np.dtype.str)
+        
+    Returns:
+        Matriz (n, 2) con las coordenadas proyectadas
+    """
+    embeddings = np.frombuffer(embeddings_bytes, dtype=dtype).reshape(shape)
+    centered = embeddings - embeddings.mean(axis=0)
+    
+    if TruncatedSVD is None:
+        # Sin sklearn se usa la SVD reducida de numpy
+        U, S, _ = np.linalg.svd(centered, full_matrices=False)
+        return U[:, :2] * S[:2]
+    
+    svd = TruncatedSVD(n_components=2, algorithm='randomized', n_iter=2, random_state=0)
+    return svd.fit_transform(centered)
+
 def create_cluster_visualization(embeddings: np.ndarray, 
                                 labels: List[int], 
                                 names: List[str] = None,
@@ -54,41 +165,58 @@ def create_cluster_visualization(embeddings: np.ndarray,
     Args:
         embeddings: Matriz de embeddings
         labels: Etiquetas de clusters
-        names: Nombres de los elementos (opcional)
+        names: Nombres de los elementos (opcional). Solo se anotan punto a punto
+               hasta MAX_ANNOT elementos; por encima se etiqueta el centroide de
+               cada cluster
         title: Título del gráfico
         
     Returns:
         Objeto Figure de matplotlib
     """
-    from sklearn.decomposition import PCA
-    
-    # Reducir dimensionalidad a 2D para visualización
-    pca = PCA(n_components=2)
-    reduced = pca.fit_transform(embeddings)
+    # Reducir dimensionalidad a 2D para visualización (memorizado entre reruns).
+    # En float32 la SVD usa BLAS de precisión simple y la clave de caché ocupa la mitad
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    reduced = _pca_2d(embeddings.tobytes(), embeddings.shape, embeddings.dtype.str)
     
     # Configurar figura
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig, ax = _subplots(figsize=(12, 8))
     
-    # Crear scatter plot por cluster
-    unique_labels = sorted(set(labels))
+    # Crear un único scatter plot coloreado por cluster
+    unique_labels, label_codes = np.unique(np.asarray(labels), return_inverse=True)
     colors = plt.cm.rainbow(np.linspace(0, 1, len(unique_labels)))
     
-    for i, cluster_id in enumerate(unique_labels):
-        cluster_points = reduced[labels == cluster_id]
-        ax.scatter(cluster_points[:, 0], cluster_points[:, 1], 
-                  color=colors[i], label=f'Cluster {cluster_id}',
-                  alpha=0.7, s=80)
+    points = ax.scatter(reduced[:, 0], reduced[:, 1], c=colors[label_codes], alpha=0.7, s=80)
+    
+    # Con muchos puntos la colección se guarda como imagen en PDF/SVG
+    if len(label_codes) > RASTERIZE_MIN_POINTS:
+        points.set_rasterized(True)
+    
+    # La leyenda se construye con marcadores de muestra, uno por cluster
+    legend_handles = [
+        Line2D([0], [0], marker='o', linestyle='', color=colors[i], alpha=0.7,
+               markersize=9, label=f'Cluster {cluster_id}')
+        for i, cluster_id in enumerate(unique_labels)
+    ]
     
     # Añadir etiquetas si se proporcionan
-    if names:
+    if names and len(names) <= MAX_ANNOT:
         for i, name in enumerate(names):
             ax.annotate(name, (reduced[i, 0], reduced[i, 1]), 
                        fontsize=8, alpha=0.7)
+    elif names:
+        # Con muchos puntos el texto domina el dibujado: solo los centroides,
+        # calculados para todos los clusters a la vez a partir de los códigos
+        k = len(unique_labels)
+        counts = np.bincount(label_codes, minlength=k)
+        centroids_x = np.bincount(label_codes, weights=reduced[:, 0], minlength=k) / counts
+        centroids_y = np.bincount(label_codes, weights=reduced[:, 1], minlength=k) / counts
+        for cluster_id, cx, cy in zip(unique_labels, centroids_x, centroids_y):
+            ax.annotate(f'Cluster {cluster_id}', (cx, cy), fontsize=9)
     
     # Configurar título y leyenda
-    plt.title(title, fontsize=14)
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.tight_layout()
+    ax.set_title(title, fontsize=14)
+    ax.legend(handles=legend_handles, bbox_to_anchor=(1.05, 1), loc='upper left')
+    fig.tight_layout()
     
     return fig
 
@@ -106,64 +234,93 @@ def format_curriculum_display(curriculum: Dict[str, List],
         return
     
     # Crear pestañas para cada semestre
-    tabs = st.tabs([f"Semestre {sem}" for sem in sorted(curriculum.keys(), key=lambda x: int(x))])
+    semestres = sorted(curriculum.keys(), key=int)
+    tabs = st.tabs([f"Semestre {sem}" for sem in semestres])
     
     # Determinar si se deben resaltar materias
-    should_highlight = highlight_subjects is not None and len(highlight_subjects) > 0
+    highlight_set = frozenset(highlight_subjects) if highlight_subjects else frozenset()
+    should_highlight = bool(highlight_set)
     
     # Mostrar materias por semestre
-    for i, semestre in enumerate(sorted(curriculum.keys(), key=lambda x: int(x))):
+    for i, semestre in enumerate(semestres):
         materias = curriculum[semestre]
         
+        # Las materias del semestre se envían en un solo bloque de markdown
+        lines = []
+        for materia in materias:
+            if isinstance(materia, dict) and "nombre" in materia:
+                # Formato para materias con detalles
+                nombre = materia["nombre"]
+            elif isinstance(materia, str):
+                # Formato para materias que son solo strings
+                nombre = materia
+            else:
+                continue
+            
+            if should_highlight and nombre in highlight_set:
+                lines.append(f"- 🌟 **{nombre}**")
+            else:
+                lines.append(f"- {nombre}")
+        
         with tabs[i]:
-            for materia in materias:
-                if isinstance(materia, dict) and "nombre" in materia:
-                    # Formato para materias con detalles
-                    nombre = materia["nombre"]
-                    if should_highlight and nombre in highlight_subjects:
-                        st.markdown(f"- 🌟 **{nombre}**")
-                    else:
-                        st.write(f"- {nombre}")
-                elif isinstance(materia, str):
-                    # Formato para materias que son solo strings
-                    if should_highlight and materia in highlight_subjects:
-                        st.markdown(f"- 🌟 **{materia}**")
-                    else:
-                        st.write(f"- {materia}")
+            if lines:
+                st.markdown("\n".join(lines))
 
 def create_stacked_bar_chart(data: Dict[str, Dict[str, int]], 
-                            title: str = "Distribución de Materias por Área") -> plt.Figure:
+                            title: str = "Distribución de Materias por Área",
+                            as_png: bool = False) -> Union[plt.Figure, bytes]:
     """
     Crea un gráfico de barras apiladas para visualizar distribución
     
     Args:
         data: Diccionario anidado con datos para graficar
         title: Título del gráfico
+        as_png: Si es True devuelve la imagen PNG ya renderizada (para st.image),
+                memorizada entre reruns
         
     Returns:
-        Objeto Figure de matplotlib
+        Objeto Figure de matplotlib, o bytes PNG si as_png es True
     """
-    # Convertir a DataFrame
-    df = pd.DataFrame(data)
+    data_key = tuple((key, tuple(values.items())) for key, values in data.items())
+    if as_png:
+        return _stacked_bar_chart_png(data_key, title)
+    return _stacked_bar_chart_figure(data_key, title)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _stacked_bar_chart_png(data_key: tuple, title: str) -> bytes:
+    """PNG de create_stacked_bar_chart, memorizado por el contenido de sus argumentos"""
+    return _figure_png(_stacked_bar_chart_figure(data_key, title))
+
+def _stacked_bar_chart_figure(data_key: tuple, title: str) -> plt.Figure:
+    """Figura de create_stacked_bar_chart"""
+    data = {key: dict(values) for key, values in data_key}
+    
+    # Convertir a DataFrame de enteros (las combinaciones ausentes cuentan 0)
+    df = pd.DataFrame.from_dict(data, orient='columns').fillna(0).astype(np.int32)
+    
+    # Categorías y subcategorías como índices categóricos (códigos enteros)
+    df.index = pd.CategoricalIndex(df.index)
+    df.columns = pd.CategoricalIndex(df.columns)
     
     # Crear figura
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = _subplots(figsize=(12, 6))
     
     # Crear gráfico de barras apiladas
     df.plot(kind='bar', stacked=True, ax=ax, colormap='viridis')
     
     # Configurar título y etiquetas
-    plt.title(title, fontsize=14)
-    plt.xlabel('Categoría')
-    plt.ylabel('Cantidad')
-    plt.legend(title='Subcategoría', bbox_to_anchor=(1.05, 1), loc='upper left')
-    plt.tight_layout()
+    ax.set_title(title, fontsize=14)
+    ax.set_xlabel('Categoría')
+    ax.set_ylabel('Cantidad')
+    ax.legend(title='Subcategoría', bbox_to_anchor=(1.05, 1), loc='upper left')
+    fig.tight_layout()
     
     return fig
 
 def create_comparison_radar_chart(data: Dict[str, List[float]], 
                                 categories: List[str],
-                                title: str = "Comparación de Perfiles") -> plt.Figure:
+                                title: str = "Comparación de Perfiles",
+                                as_png: bool = False) -> Union[plt.Figure, bytes]:
     """
     Crea un gráfico de radar para comparar perfiles
     
@@ -171,35 +328,59 @@ def create_comparison_radar_chart(data: Dict[str, List[float]],
         data: Diccionario con nombres como claves y listas de valores como valores
         categories: Lista de nombres de categorías
         title: Título del gráfico
+        as_png: Si es True devuelve la imagen PNG ya renderizada (para st.image),
+                memorizada entre reruns
         
     Returns:
-        Objeto Figure de matplotlib
+        Objeto Figure de matplotlib, o bytes PNG si as_png es True
     """
+    data_key = tuple((name, tuple(float(v) for v in values)) for name, values in data.items())
+    if as_png:
+        return _radar_chart_png(data_key, tuple(categories), title)
+    return _radar_chart_figure(data_key, tuple(categories), title)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _radar_chart_png(data_key: tuple, categories: tuple, title: str) -> bytes:
+    """PNG de create_comparison_radar_chart, memorizado por el contenido de sus argumentos"""
+    return _figure_png(_radar_chart_figure(data_key, categories, title))
+
+def _radar_chart_figure(data_key: tuple, categories: tuple, title: str) -> plt.Figure:
+    """Figura de create_comparison_radar_chart"""
+    data = dict(data_key)
+    categories = list(categories)
+    
     # Número de categorías
     N = len(categories)
     
     # Crear figura
-    fig, ax = plt.subplots(figsize=(8, 8), subplot_kw=dict(polar=True))
+    fig, ax = _subplots(figsize=(8, 8), subplot_kw=dict(polar=True))
     
     # Ángulos para el gráfico de radar
-    angles = [n / float(N) * 2 * np.pi for n in range(N)]
-    angles += angles[:1]  # Cerrar el círculo
+    angles = np.linspace(0, 2 * np.pi, N, endpoint=False)
+    angles_closed = np.concatenate((angles, angles[:1]))  # Cerrar el círculo
     
     # Añadir categorías como etiquetas
-    plt.xticks(angles[:-1], categories)
+    ax.set_xticks(angles)
+    ax.set_xticklabels(categories)
     
     # Graficar cada perfil
     for name, values in data.items():
-        values_with_closure = values + values[:1]  # Cerrar el polígono
-        ax.plot(angles, values_with_closure, linewidth=2, label=name)
-        ax.fill(angles, values_with_closure, alpha=0.25)
+        values = np.asarray(values, dtype=np.float32)
+        values_with_closure = np.concatenate((values, values[:1]))  # Cerrar el polígono
+        ax.plot(angles_closed, values_with_closure, linewidth=2, label=name)
+        ax.fill(angles_closed, values_with_closure, alpha=0.25)
     
     # Configurar título y leyenda
-    plt.title(title, fontsize=14)
-    plt.legend(loc='upper right')
+    ax.set_title(title, fontsize=14)
+    ax.legend(loc='upper right')
     
     return fig
 
+@lru_cache(maxsize=64)
+def _sorted_tuple(items: tuple) -> tuple:
+    """Ordena nombres sin distinguir mayúsculas, memorizado entre reruns"""
+    return tuple(sorted(items, key=str.casefold))
+
 def display_recommendation_summary(recommendations: Dict[str, Any]) -> None:
     """
     Muestra un resumen de recomendaciones en Streamlit
@@ -220,8 +401,7 @@ def display_recommendation_summary(recommendations: Dict[str, Any]) -> None:
         existing = recommendations["materias_existentes"]
         
         if existing:
-            for materia in sorted(existing):
-                st.markdown(f"- ✅ {materia}")
+            st.markdown("\n".join(f"- ✅ {materia}" for materia in _sorted_tuple(tuple(existing))))
         else:
             st.info("No se identificaron materias existentes")
     
@@ -231,8 +411,7 @@ def display_recommendation_summary(recommendations: Dict[str, Any]) -> None:
         to_add = recommendations["materias_a_agregar"]
         
         if to_add:
-            for materia in sorted(to_add):
-                st.markdown(f"- ⭐ {materia}")
+            st.markdown("\n".join(f"- ⭐ {materia}" for materia in _sorted_tuple(tuple(to_add))))
         else:
             st.success("No se requiere agregar materias adicionales")
     
@@ -241,6 +420,5 @@ def display_recommendation_summary(recommendations: Dict[str, Any]) -> None:
         metrics = recommendations["metricas"]
         cols = st.columns(len(metrics))
         
-        for i, (key, value) in enumerate(metrics.items()):
-            with cols[i]:
-                st.metric(label=key, value=value)
+        for col, (key, value) in zip(cols, metrics.items()):
+            col.metric(label=key, value=value)